@@ -0,0 +1,41 @@
+"""Measure how long `import daglet` takes in a fresh interpreter.
+
+Usage:
+    python benchmarks/import_time.py [--count N]
+
+Each sample runs a new python process and times the import itself (excluding interpreter startup), reporting the
+best and median times.  Make sure the package has been byte-compiled first (e.g. `python -m compileall daglet`), or
+the numbers will include compilation.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import os
+import subprocess
+import sys
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = 'import time; start = time.time(); import daglet; print(time.time() - start)'
+
+
+def measure(count):
+    times = []
+    for _ in range(count):
+        output = subprocess.check_output([sys.executable, '-c', SCRIPT], cwd=ROOT_DIR)
+        times.append(float(output.decode().strip()))
+    return sorted(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--count', type=int, default=20, help='number of samples')
+    args = parser.parse_args()
+    times = measure(args.count)
+    print('import daglet: best {:.2f} ms, median {:.2f} ms ({} samples)'.format(times[0] * 1000,
+        times[len(times) // 2] * 1000, len(times)))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,12 @@ from __future__ import unicode_literals
 from ._utils import get_hash_int
 from builtins import object
 from collections import defaultdict
+from collections import deque
 import copy
+import importlib
+import sys
+import threading
+import weakref
 
 
 def _arg_kwarg_repr(args=[], kwargs={}):
@@ -20,16 +25,65 @@ class Vertex(object):
 
         Vertices are immutable, and the hash should remain constant as a result.  If a vertex with new contents is
         required, create a new vertex and throw the old one away.
+
+    Lazy hashing:
+        By default the hash is computed when the vertex is constructed.  If ``lazy_hash`` is true, hashing is deferred
+        until the hash is first needed (e.g. by ``hash()``, comparisons, or ``short_hash``), at which point the hashes
+        of any unhashed ancestors are computed iteratively and cached.  This avoids paying for hashing when a graph is
+        only built and walked via ``parents``/``label``.
+
+        Since sorting requires hashing, lazily-hashed vertices keep ``parents`` in the order they were specified rather
+        than in sorted order.  The hash itself is the same as that of an equivalent eagerly-hashed vertex.
+
+        Vertices created with :meth:`vertex`, :meth:`clone`, and :meth:`transplant` inherit the hashing mode.
     """
-    def __init__(self, label=None, parents=[], extra_hash=None):
+    def __init__(self, label=None, parents=[], extra_hash=None, lazy_hash=False):
         for parent in parents:
             if not isinstance(parent, Vertex):
                 raise TypeError('Expected Vertex instance; got {}'.format(parent))
-        parents = sorted(parents)
+        parents = list(parents) if lazy_hash else sorted(parents)
+        self.__init_fields(label, parents, extra_hash, lazy_hash)
+
+    def __init_fields(self, label, parents, extra_hash, lazy_hash, hash=None):
         self.__parents = parents
         self.__label = copy.copy(label)
         self.__extra_hash = copy.copy(extra_hash)
-        self.__hash = get_hash_int([label, parents, extra_hash]) % (2**63)
+        self.__lazy_hash = lazy_hash
+        if hash is None and not lazy_hash:
+            hash = self.__get_hash()
+        self.__hash = hash
+
+    def __get_hash(self):
+        parents = sorted(self.__parents) if self.__lazy_hash else self.__parents
+        return get_hash_int([self.__label, parents, self.__extra_hash]) % (2**63)
+
+    def __compute_lazy_hashes(self):
+        # Hash ancestors first (post-order) with an explicit stack so that deep ancestries don't hit the recursion
+        # limit.
+        stack = [self]
+        while stack:
+            vertex = stack[-1]
+            if vertex.__hash is not None:
+                stack.pop()
+                continue
+            unhashed_parents = [x for x in vertex.__parents if x.__hash is None]
+            if unhashed_parents:
+                stack.extend(unhashed_parents)
+            else:
+                vertex.__hash = vertex.__get_hash()
+                stack.pop()
+
+    @classmethod
+    def _create(cls, label, parents, extra_hash, lazy_hash=False, hash=None):
+        """Create a vertex without validating ``parents``; the parents must already be sorted unless ``lazy_hash`` is
+        true.
+
+        If ``hash`` is specified (e.g. when restoring a previously hashed vertex), it is used as-is instead of being
+        recomputed.
+        """
+        vertex = cls.__new__(cls)
+        vertex.__init_fields(label, parents, extra_hash, lazy_hash, hash)
+        return vertex
 
     @property
     def parents(self):
@@ -46,7 +100,13 @@ class Vertex(object):
     def extra_hash(self):
         return self.__extra_hash
 
+    @property
+    def lazy_hash(self):
+        return self.__lazy_hash
+
     def __hash__(self):
+        if self.__hash is None:
+            self.__compute_lazy_hashes()
         return self.__hash
 
     def __lt__(self, other):
@@ -93,13 +153,55 @@ class Vertex(object):
             'label': self.__label,
             'parents': self.__parents,
             'extra_hash': self.__extra_hash,
+            'lazy_hash': self.__lazy_hash,
         }
         base_kwargs.update(kwargs)
         return Vertex(**base_kwargs)
 
     def transplant(self, new_parents):
         """Create a copy of this Vertex with new parent edges."""
-        return Vertex(self.__label, new_parents, self.__extra_hash)
+        return Vertex(self.__label, new_parents, self.__extra_hash, self.__lazy_hash)
+
+    def __reduce__(self):
+        # The parents are pickled as `Vertex` objects, so that pickle's memo shares common ancestors and vertices that
+        # are pickled together keep their identity.  To keep pickle from recursing through deep ancestries, a window
+        # of the nearest ancestors is pickled first, in topological order so that each one's parents are already in
+        # the memo, and before that the vertices just beyond the window.  Those are pickled the same way but with a
+        # window twice as large, so the nesting depth only grows logarithmically with the depth of the graph.
+        fields = (self.__label, self.__parents, self.__extra_hash, self.__lazy_hash, hash(self))
+        scopes = _get_open_pickle_scopes()
+        if not self.__parents or any(id(self) in x.window_ids for x in scopes):
+            return _restore_vertex, (None,) + fields
+        window_vertices, frontier_vertices = _get_pickle_window(self, _PICKLE_WINDOW_SIZE << len(scopes))
+        scope = _PickleScope(window_vertices)
+        prelude = (scope, frontier_vertices, window_vertices)
+        return _restore_vertex, (prelude,) + fields + (_PickleScopeExit(scope),)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        # Copy ancestors that aren't already in the memo bottom-up, so that vertices copied together share copies of
+        # their common ancestors.
+        stack = [self]
+        while stack:
+            vertex = stack[-1]
+            if id(vertex) in memo:
+                stack.pop()
+                continue
+            uncopied_parents = [x for x in vertex.__parents if id(x) not in memo]
+            if uncopied_parents:
+                stack.extend(uncopied_parents)
+            else:
+                memo[id(vertex)] = Vertex._create(
+                    copy.deepcopy(vertex.__label, memo),
+                    [memo[id(x)] for x in vertex.__parents],
+                    copy.deepcopy(vertex.__extra_hash, memo),
+                    vertex.__lazy_hash,
+                    hash(vertex),
+                )
+                stack.pop()
+        return memo[id(self)]
 
     def vertex(self, label=None, extra_hash=None):
         """Create downstream vertex with specified label.
@@ -110,10 +212,124 @@ class Vertex(object):
             n3 = daglet.Vertex('n1').vertex('n2').vertex('n3')
             ```
         """
-        return Vertex(label, [self], extra_hash)
+        return Vertex(label, [self], extra_hash, self.__lazy_hash)
+
+
+def _flatten_vertices(vertices):
+    """Collect all vertices reachable from ``vertices`` in topological order, without recursion.
+
+    Returns:
+        ``(sorted_vertices, index_map)`` tuple, where ``index_map`` maps each vertex to its index in
+        ``sorted_vertices``.
+    """
+    sorted_vertices = []
+    index_map = {}
+    for root in vertices:
+        stack = [root]
+        while stack:
+            vertex = stack[-1]
+            if vertex in index_map:
+                stack.pop()
+                continue
+            unvisited_parents = [x for x in vertex.parents if x not in index_map]
+            if unvisited_parents:
+                stack.extend(reversed(unvisited_parents))
+            else:
+                index_map[vertex] = len(sorted_vertices)
+                sorted_vertices.append(vertex)
+                stack.pop()
+    return sorted_vertices, index_map
+
+
+_PICKLE_WINDOW_SIZE = 8
+
+_pickle_state = threading.local()
+
+
+def _get_open_pickle_scopes():
+    """Get the pickle scopes that are currently open in this thread, outermost first.
+
+    Scopes are only tracked with weak references, and the pickler holds the only strong ones, so scopes that are left
+    open because pickling failed are dropped along with the pickler.
+    """
+    scope_refs = [x for x in getattr(_pickle_state, 'scope_refs', []) if x() is not None]
+    _pickle_state.scope_refs = scope_refs
+    return [x() for x in scope_refs]
+
+
+def _get_pickle_window(vertex, size):
+    """Find up to ``size`` of the nearest ancestors of ``vertex`` (breadth-first), without recursion.
+
+    Returns:
+        ``(window_vertices, frontier_vertices)`` tuple, where ``window_vertices`` are the ancestors in topological
+        order and ``frontier_vertices`` are the parents of window vertices that aren't in the window themselves.
+    """
+    window_map = {}
+    queue = deque(vertex.parents)
+    while queue and len(window_map) < size:
+        parent = queue.popleft()
+        if id(parent) not in window_map:
+            window_map[id(parent)] = parent
+            queue.extend(parent.parents)
+    frontier_map = {id(x): x for x in queue if id(x) not in window_map}
+
+    window_vertices = []
+    visited_ids = set()
+    for root in window_map.values():
+        stack = [root]
+        while stack:
+            window_vertex = stack[-1]
+            if id(window_vertex) in visited_ids:
+                stack.pop()
+                continue
+            unvisited_parents = [
+                x for x in window_vertex.parents if id(x) in window_map and id(x) not in visited_ids
+            ]
+            if unvisited_parents:
+                stack.extend(unvisited_parents)
+            else:
+                visited_ids.add(id(window_vertex))
+                window_vertices.append(window_vertex)
+                stack.pop()
+    return window_vertices, list(frontier_map.values())
+
+
+class _PickleScope(object):
+    """Marker that opens a pickle window when it's pickled (see :meth:`Vertex.__reduce__`).
+
+    While the scope is open, the window's vertices are pickled without windows of their own, and the vertices just
+    beyond the window get larger windows.
+    """
+    def __init__(self, window_vertices):
+        self.window_vertices = window_vertices
+        self.window_ids = set(id(x) for x in window_vertices)
+
+    def __reduce__(self):
+        _get_open_pickle_scopes()
+        _pickle_state.scope_refs.append(weakref.ref(self))
+        return tuple, ()
 
 
-def __check_parent_func(objs, parent_func):
+class _PickleScopeExit(object):
+    """Marker that closes a :class:`_PickleScope` when it's pickled."""
+    def __init__(self, scope):
+        self.scope = scope
+
+    def __reduce__(self):
+        _get_open_pickle_scopes()
+        _pickle_state.scope_refs = [x for x in _pickle_state.scope_refs if x() is not self.scope]
+        return tuple, ()
+
+
+def _restore_vertex(prelude, label, parents, extra_hash, lazy_hash, hash, scope_exit=None):
+    """Unpickle a vertex pickled by :meth:`Vertex.__reduce__`; the prelude was only needed for pickling order."""
+    return Vertex._create(label, parents, extra_hash, lazy_hash, hash)
+
+
+_NOTHING = object()
+
+
+def _check_parent_func(objs, parent_func):
     if parent_func is None:
         if any(not isinstance(obj, Vertex) for obj in objs):
             raise TypeError('`parent_func` must be specified if objects are not daglet.Vertex instances')
@@ -121,35 +337,293 @@ def __check_parent_func(objs, parent_func):
     return parent_func
 
 
-def toposort(objs, parent_func=None, tree=False):
-    parent_func = __check_parent_func(objs, parent_func)
+def _cache_parent_func(parent_func):
+    """Wrap ``parent_func`` so that it's only called once per object."""
+    parent_map = {}
+
+    def get_parents(obj):
+        if obj not in parent_map:
+            parent_map[obj] = parent_func(obj)
+        return parent_map[obj]
+    return get_parents
+
+
+def _fetch_parent_map(objs, batch_parent_func, parent_batch_size=None, prefetch=0, is_leaf=None):
+    """Discover the parents of ``objs`` and all of their ancestors with ``batch_parent_func``.
+
+    ``batch_parent_func`` is called with the whole frontier of newly discovered objects at a time (in chunks of at most
+    ``parent_batch_size``), so discovering a graph takes a number of calls proportional to its depth rather than its size.
+    If ``prefetch`` is nonzero, up to ``prefetch`` additional calls are kept in flight on background threads, and
+    each chunk's newly discovered parents are requested as soon as the chunk comes back rather than waiting for the
+    rest of the frontier.
+
+    Objects for which ``is_leaf(obj)`` is true are given no parents without being requested.
+    """
+    parent_map = {}
+    requested_objs = set()
+    pending_objs = deque()
+
+    def add_pending(new_objs):
+        for obj in new_objs:
+            if obj not in requested_objs:
+                requested_objs.add(obj)
+                if is_leaf is not None and is_leaf(obj):
+                    parent_map[obj] = []
+                else:
+                    pending_objs.append(obj)
+
+    def pop_chunk(slot_count):
+        chunk_size = parent_batch_size or max(1, -(-len(pending_objs) // slot_count))
+        return [pending_objs.popleft() for _ in range(min(chunk_size, len(pending_objs)))]
+
+    def add_results(chunk, chunk_parent_map):
+        for obj in chunk:
+            parent_map[obj] = list(chunk_parent_map[obj])
+        for obj in chunk:
+            add_pending(parent_map[obj])
+
+    add_pending(objs)
+    if not prefetch:
+        while pending_objs:
+            chunk = pop_chunk(1)
+            add_results(chunk, batch_parent_func(chunk))
+        return parent_map
+
+    from queue import Queue
+
+    result_queue = Queue()
+
+    def fetch(chunk):
+        try:
+            result_queue.put((chunk, batch_parent_func(chunk), None))
+        except Exception as e:
+            result_queue.put((chunk, None, e))
+
+    in_flight_count = 0
+    while pending_objs or in_flight_count:
+        while pending_objs and in_flight_count <= prefetch:
+            thread = threading.Thread(target=fetch, args=(pop_chunk(prefetch + 1 - in_flight_count),))
+            thread.daemon = True
+            thread.start()
+            in_flight_count += 1
+        chunk, chunk_parent_map, error = result_queue.get()
+        in_flight_count -= 1
+        if error is not None:
+            raise error
+        add_results(chunk, chunk_parent_map)
+    return parent_map
+
+
+def toposort(objs, parent_func=None, tree=False, batch_parent_func=None, parent_batch_size=None, prefetch=0):
+    """Sort objects and all of their ancestors so that every object comes after its parents.
+
+    Args:
+        parent_func: function that returns the parents of an object.
+        tree: if true, shared ancestors are visited again for every path that leads to them (see also
+            :func:`iter_tree` and :func:`get_path_counts`).
+        batch_parent_func: alternative to ``parent_func`` for parents that are expensive to look up one at a time
+            (e.g. from a database or a git object store).  It's called as ``batch_parent_func(objs)`` with a batch of
+            objects and must return a dictionary mapping each of them to its parents.  The graph is discovered one
+            frontier at a time, and the results are cached for the rest of the operation.
+        parent_batch_size: maximum number of objects per ``batch_parent_func`` call; unlimited by default.
+        prefetch: number of additional ``batch_parent_func`` calls to keep in flight concurrently.
+    """
+    if parent_func is not None and batch_parent_func is not None:
+        raise TypeError('Only one of `parent_func` and `batch_parent_func` may be specified')
+    if batch_parent_func is not None:
+        parent_func = _fetch_parent_map(objs, batch_parent_func, parent_batch_size, prefetch).__getitem__
+    parent_func = _check_parent_func(objs, parent_func)
     marked_objs = set()
     sorted_objs = []
+    sorted_obj_set = set()
 
-    def visit(obj, child_obj):
+    def check_unmarked(obj):
         if not tree and obj in marked_objs:
             # TODO: optionally break cycles.
             raise RuntimeError('Graph is not a DAG; recursively encountered {}'.format(obj))
 
-        if tree or obj not in sorted_objs:
-            parent_objs = parent_func(obj)
-
-            marked_objs.add(obj)
-            for parent_obj in parent_objs:
-                visit(parent_obj, obj)
-            marked_objs.remove(obj)
-
-            sorted_objs.append(obj)
+    def visit(obj):
+        # Depth-first post-order traversal with an explicit stack so that deep graphs don't hit the recursion limit.
+        check_unmarked(obj)
+        if not tree and obj in sorted_obj_set:
+            return
+        stack = [(obj, iter(parent_func(obj)))]
+        marked_objs.add(obj)
+        while stack:
+            obj, parent_iter = stack[-1]
+            parent_obj = next(parent_iter, _NOTHING)
+            if parent_obj is _NOTHING:
+                stack.pop()
+                marked_objs.discard(obj)
+                sorted_objs.append(obj)
+                sorted_obj_set.add(obj)
+            else:
+                check_unmarked(parent_obj)
+                if tree or parent_obj not in sorted_obj_set:
+                    stack.append((parent_obj, iter(parent_func(parent_obj))))
+                    if not tree:
+                        marked_objs.add(parent_obj)
 
     unvisited_objs = copy.copy(objs)
     while unvisited_objs:
         obj = unvisited_objs.pop()
-        visit(obj, None)
+        visit(obj)
     return sorted_objs
 
 
-def transform(objs, parent_func=None, vertex_func=None, edge_func=None, vertex_map={}):
-    parent_func = __check_parent_func(objs, parent_func)
+def get_path_counts(objs, parent_func=None):
+    """Count how many times each vertex appears in the tree unfolding of a DAG, without unfolding it.
+
+    The tree unfolding (as produced by ``toposort(objs, parent_func, tree=True)``) contains each vertex once per path
+    from one of ``objs`` down to it, which can be exponential in the size of the graph.  The counts are instead
+    computed with dynamic programming in linear time: each vertex's count is the sum of its children's counts (plus
+    one for each time it appears in ``objs``).
+
+    Returns:
+        Dictionary mapping each vertex to its number of occurrences; the total size of the unfolded tree is the sum of
+        the values.
+    """
+    parent_func = _check_parent_func(objs, parent_func)
+    path_counts = defaultdict(int)
+    for obj in objs:
+        path_counts[obj] += 1
+    for obj in reversed(toposort(objs, parent_func)):
+        for parent_obj in parent_func(obj):
+            path_counts[parent_obj] += path_counts[obj]
+    return dict(path_counts)
+
+
+def iter_tree(objs, parent_func=None):
+    """Lazily iterate over the tree unfolding of a DAG.
+
+    Yields ``(obj, path)`` pairs in the same order as ``toposort(objs, parent_func, tree=True)``, where ``path`` is
+    the tuple of vertices from the root (one of ``objs``) down to and including ``obj``.  Only the current path is
+    kept in memory, so callers can stop early or stream over trees that would be too large to materialize.
+    """
+    parent_func = _check_parent_func(objs, parent_func)
+    for root in reversed(list(objs)):
+        stack = [((root,), iter(parent_func(root)))]
+        while stack:
+            path, parent_iter = stack[-1]
+            parent_obj = next(parent_iter, _NOTHING)
+            if parent_obj is _NOTHING:
+                stack.pop()
+                yield path[-1], path
+            else:
+                stack.append((path + (parent_obj,), iter(parent_func(parent_obj))))
+
+
+def _as_list(items):
+    if items is None:
+        return None
+    elif hasattr(items, 'tolist'):
+        # Convert numpy arrays (and numpy scalars within them) into native python values so that hashes match those
+        # of vertices constructed by hand.
+        return items.tolist()
+    return list(items)
+
+
+def build_vertices(ids, labels=None, edge_src=[], edge_dst=[], extra_hashes=None):
+    """Build a graph of :class:`Vertex` objects in bulk from edge arrays.
+
+    Args:
+        ids: sequence (or numpy array) of unique vertex ids.
+        labels: optional sequence of vertex labels, parallel to ``ids``; defaults to using the ids as labels.
+        edge_src: sequence of parent vertex ids.
+        edge_dst: sequence of child vertex ids, parallel to ``edge_src``; each pair ``(edge_src[i], edge_dst[i])``
+            describes a ``parent -> child`` edge.
+        extra_hashes: optional sequence of ``extra_hash`` values, parallel to ``ids``.
+
+    Returns:
+        Dictionary mapping each id to its :class:`Vertex`.
+
+    The input doesn't need to be in any particular order; the vertices are topologically ordered internally and
+    constructed in a single pass, without the per-vertex validation done by the :class:`Vertex` constructor.
+
+    Example:
+        ```
+        vertex_map = daglet.build_vertices(['a', 'b', 'c'], edge_src=['a', 'b'], edge_dst=['b', 'c'])
+        assert vertex_map['c'] == daglet.Vertex('a').vertex('b').vertex('c')
+        ```
+    """
+    ids = _as_list(ids)
+    labels = _as_list(labels) if labels is not None else ids
+    extra_hashes = _as_list(extra_hashes) if extra_hashes is not None else [None] * len(ids)
+    edge_src = _as_list(edge_src)
+    edge_dst = _as_list(edge_dst)
+    if not len(labels) == len(extra_hashes) == len(ids):
+        raise ValueError('Expected `labels` and `extra_hashes` to have the same length as `ids`')
+    if len(edge_src) != len(edge_dst):
+        raise ValueError('Expected `edge_src` and `edge_dst` to have the same length')
+
+    index_map = {id: index for index, id in enumerate(ids)}
+    if len(index_map) != len(ids):
+        raise ValueError('Expected `ids` to be unique')
+    parent_indexes = [[] for _ in ids]
+    child_indexes = [[] for _ in ids]
+    try:
+        for src, dst in zip(edge_src, edge_dst):
+            src_index = index_map[src]
+            dst_index = index_map[dst]
+            parent_indexes[dst_index].append(src_index)
+            child_indexes[src_index].append(dst_index)
+    except KeyError as e:
+        raise ValueError('Edge refers to unknown vertex id {}'.format(e.args[0]))
+
+    # Kahn's algorithm; vertices are constructed as soon as all of their parents exist.
+    remaining_counts = [len(x) for x in parent_indexes]
+    ready_indexes = deque(index for index, count in enumerate(remaining_counts) if count == 0)
+    vertices = [None] * len(ids)
+    hash_key = Vertex.__hash__
+    while ready_indexes:
+        index = ready_indexes.popleft()
+        parents = sorted([vertices[x] for x in parent_indexes[index]], key=hash_key)
+        vertices[index] = Vertex._create(labels[index], parents, extra_hashes[index])
+        for child_index in child_indexes[index]:
+            remaining_counts[child_index] -= 1
+            if remaining_counts[child_index] == 0:
+                ready_indexes.append(child_index)
+
+    if any(x is None for x in vertices):
+        cycle_id = next(id for id, vertex in zip(ids, vertices) if vertex is None)
+        raise RuntimeError('Graph is not a DAG; encountered cycle involving {}'.format(cycle_id))
+    return dict(zip(ids, vertices))
+
+
+def transform(objs, parent_func=None, vertex_func=None, edge_func=None, vertex_map={}, batch_vertex_func=None,
+        batch_size=None, batch_parent_func=None, parent_batch_size=None, prefetch=0):
+    """Transform a DAG by computing a value for each vertex (and edge) from the values of its parents.
+
+    Args:
+        vertex_func: ``vertex_func(obj, parent_values)`` function that returns the value of a vertex.
+        edge_func: ``edge_func(parent_obj, obj, parent_value)`` function that returns the value of an edge, which is
+            what gets passed to ``vertex_func`` as the parent value; defaults to passing the parent value through.
+        vertex_map: precomputed vertex values; the ancestors of these vertices aren't visited.
+        batch_vertex_func: alternative to ``vertex_func`` for work that is more efficient in batches (e.g. model
+            inference or database queries).  It's called as ``batch_vertex_func(objs, parent_values_list)`` with
+            vertices from a single topological level (i.e. vertices whose parents are all done), and must return a
+            sequence with one value per vertex.
+        batch_size: maximum number of vertices per ``batch_vertex_func`` call; unlimited by default.
+        batch_parent_func: alternative to ``parent_func`` that looks up the parents of a batch of objects at once; see
+            :func:`toposort`.
+        parent_batch_size: maximum number of objects per ``batch_parent_func`` call; unlimited by default.
+        prefetch: number of additional ``batch_parent_func`` calls to keep in flight concurrently.
+
+    ``parent_func`` (or ``batch_parent_func``) is called at most once per object.
+
+    Returns:
+        ``(vertex_map, edge_map)`` tuple of the computed vertex and edge values.
+    """
+    if parent_func is not None and batch_parent_func is not None:
+        raise TypeError('Only one of `parent_func` and `batch_parent_func` may be specified')
+    if batch_parent_func is not None:
+        is_leaf = (lambda x: x in vertex_map) if vertex_map is not None else None
+        parent_func = _fetch_parent_map(objs, batch_parent_func, parent_batch_size, prefetch, is_leaf).__getitem__
+    elif parent_func is not None:
+        parent_func = _cache_parent_func(parent_func)
+    parent_func = _check_parent_func(objs, parent_func)
+    if vertex_func is not None and batch_vertex_func is not None:
+        raise TypeError('Only one of `vertex_func` and `batch_vertex_func` may be specified')
     if vertex_func is None:
         vertex_func = lambda obj, parent_values: None
     if vertex_map is not None:
@@ -162,22 +636,56 @@ def transform(objs, parent_func=None, vertex_func=None, edge_func=None, vertex_m
 
     new_vertex_map = {}
     new_edge_map = {}
+
+    def get_parent_values(obj):
+        parent_values = []
+        for parent_obj in parent_func(obj):
+            value = edge_func(parent_obj, obj, new_vertex_map[parent_obj])
+            new_edge_map[parent_obj, obj] = value
+            parent_values.append(value)
+        return parent_values
+
+    if batch_vertex_func is not None:
+        for obj in sorted_objs:
+            if obj in vertex_map:
+                new_vertex_map[obj] = vertex_map[obj]
+        for batch_objs in _get_batches(sorted_objs, parent_func, vertex_map, batch_size):
+            parent_values_list = [get_parent_values(obj) for obj in batch_objs]
+            values = list(batch_vertex_func(batch_objs, parent_values_list))
+            if len(values) != len(batch_objs):
+                raise ValueError('Expected `batch_vertex_func` to return {} values; got {}'.format(len(batch_objs),
+                    len(values)))
+            new_vertex_map.update(zip(batch_objs, values))
+        return new_vertex_map, new_edge_map
+
     for obj in sorted_objs:
         if obj in vertex_map:
             value = vertex_map[obj]
         else:
-            parent_objs = parent_func(obj)
-            parent_values = []
-            for parent_obj in parent_objs:
-                value = edge_func(parent_obj, obj, new_vertex_map[parent_obj])
-                new_edge_map[parent_obj, obj] = value
-                parent_values.append(value)
-            value = vertex_func(obj, parent_values)
+            value = vertex_func(obj, get_parent_values(obj))
         new_vertex_map[obj] = value
 
     return new_vertex_map, new_edge_map
 
 
+def _get_batches(sorted_objs, parent_func, vertex_map, batch_size):
+    """Group the vertices that need computing by topological level, in chunks of at most ``batch_size``."""
+    level_map = {}
+    level_objs = defaultdict(list)
+    for obj in sorted_objs:
+        if obj in vertex_map:
+            level_map[obj] = -1
+        else:
+            level = max([level_map[x] for x in parent_func(obj)] + [-1]) + 1
+            level_map[obj] = level
+            level_objs[level].append(obj)
+    for level in sorted(level_objs):
+        objs = level_objs[level]
+        chunk_size = batch_size or len(objs)
+        for start in range(0, len(objs), chunk_size):
+            yield objs[start:start + chunk_size]
+
+
 def transform_vertices(objs, parent_func, vertex_func, vertex_map={}):
     vertex_map, _ = transform(objs, parent_func, vertex_func, None, vertex_map)
     return vertex_map
@@ -206,5 +714,169 @@ def get_child_map(objs, parent_func):
     return child_map
 
 
+def canonicalize(objs, parent_func, key_func):
+    """Merge structurally equivalent vertices of an arbitrary-object DAG.
+
+    Each vertex gets a structural key, computed bottom-up from ``key_func(obj)`` and the keys of its parents (in
+    order).  Vertices with equal keys are merged into a single representative (the first such vertex in topological
+    order).  Keys are compared by equality rather than by hash, and the parents' keys are interned as small integers
+    so that keys don't grow with the depth of the graph.
+
+    Args:
+        objs: objects to canonicalize, along with all of their ancestors.
+        parent_func: function that returns the parents of an object.
+        key_func: function that returns the hashable contents of an object, excluding its parents (e.g. an
+            operation name and its arguments).  Objects are only merged if their contents compare equal.
+
+    Returns:
+        ``(obj_map, parent_map)`` tuple, where ``obj_map`` maps every object to its representative and ``parent_map``
+        maps each representative to its (representative) parents.
+
+    Example:
+        Evaluate each distinct subcomputation only once:
+        ```
+        obj_map, parent_map = daglet.canonicalize(objs, get_parents, get_key)
+        vertex_map = daglet.transform_vertices([obj_map[x] for x in objs], parent_map.__getitem__, vertex_func)
+        value = vertex_map[obj_map[objs[0]]]
+        ```
+    """
+    key_map = {}
+    representative_map = {}
+    obj_map = {}
+    parent_map = {}
+    for obj in toposort(objs, parent_func):
+        parent_objs = parent_func(obj)
+        key = (key_func(obj), tuple(key_map[x] for x in parent_objs))
+        representative = representative_map.get(key)
+        if representative is None:
+            representative = obj
+            representative_map[key] = obj
+            parent_map[obj] = [obj_map[x] for x in parent_objs]
+            key_map[obj] = len(representative_map)
+        else:
+            key_map[obj] = key_map[representative]
+        obj_map[obj] = representative
+    return obj_map, parent_map
+
+
+def transitive_reduction(objs, parent_func=None):
+    """Compute the transitive reduction of a DAG, i.e. drop every edge that is implied by a longer path.
+
+    For example, the edge ``A -> C`` is dropped if ``A -> B -> C`` exists.  Duplicate edges are dropped as well.
+
+    The set of ancestors of each vertex is tracked as a bitset (a python integer indexed by topological position), so
+    the cost is roughly ``O(E * V / wordsize)`` time.  A vertex's bitset is dropped as soon as its last child has been
+    processed, so only the bitsets of vertices with unprocessed children are held at a time (e.g. a single one for a
+    chain), rather than ``O(V^2 / 8)`` bytes for all of them.
+
+    Returns:
+        Dictionary mapping each object to its list of remaining parents, in the order returned by ``parent_func``.
+    """
+    parent_func = _check_parent_func(objs, parent_func)
+    sorted_objs = toposort(objs, parent_func)
+    index_map = {obj: index for index, obj in enumerate(sorted_objs)}
+    parent_objs_list = [parent_func(x) for x in sorted_objs]
+    remaining_child_counts = [0] * len(sorted_objs)
+    for parent_objs in parent_objs_list:
+        for parent_obj in parent_objs:
+            remaining_child_counts[index_map[parent_obj]] += 1
+    ancestor_bitsets = {}
+    parent_map = {}
+    for index, obj in enumerate(sorted_objs):
+        parent_objs = parent_objs_list[index]
+        parent_indexes = [index_map[x] for x in parent_objs]
+        indirect_bitset = 0
+        for parent_index in parent_indexes:
+            indirect_bitset |= ancestor_bitsets[parent_index]
+
+        # A parent is redundant if it's also reachable through another parent.
+        reduced_parent_objs = []
+        direct_bitset = 0
+        for parent_obj, parent_index in zip(parent_objs, parent_indexes):
+            parent_bit = 1 << parent_index
+            if not (indirect_bitset | direct_bitset) & parent_bit:
+                reduced_parent_objs.append(parent_obj)
+                direct_bitset |= parent_bit
+        parent_map[obj] = reduced_parent_objs
+        if remaining_child_counts[index]:
+            ancestor_bitsets[index] = indirect_bitset | direct_bitset
+        for parent_index in parent_indexes:
+            remaining_child_counts[parent_index] -= 1
+            if not remaining_child_counts[parent_index]:
+                del ancestor_bitsets[parent_index]
+    return parent_map
+
+
+def transitive_reduction_vertices(vertices):
+    """Rebuild a :class:`Vertex` graph with redundant edges removed (see :func:`transitive_reduction`).
+
+    Returns:
+        Dictionary mapping each original vertex to its reduced counterpart.
+    """
+    parent_map = transitive_reduction(vertices)
+    return transform_vertices(vertices, parent_map.__getitem__, lambda vertex, parents: vertex.transplant(parents))
+
+
+__all__ = [
+    'CostModel',
+    'DynamicDag',
+    'Vertex',
+    'build_vertices',
+    'canonicalize',
+    'distributed_transform',
+    'dump',
+    'get_child_map',
+    'get_parent_map',
+    'get_path_counts',
+    'iter_tree',
+    'load',
+    'parallel_transform',
+    'partition',
+    'toposort',
+    'transform',
+    'transform_edges',
+    'transform_vertices',
+    'transitive_reduction',
+    'transitive_reduction_vertices',
+    'view',
+]
+
+
+# Attributes that are provided by submodules, which are only imported once first used in order to keep
+# `import daglet` fast.
+_LAZY_ATTR_MODULES = {
+    'CostModel': 'schedule',
+    'DynamicDag': 'dynamic',
+    'distributed_transform': 'distributed',
+    'dump': 'serialize',
+    'load': 'serialize',
+    'parallel_transform': 'schedule',
+    'partition': 'partitioning',
+}
+_LAZY_MODULES = set(_LAZY_ATTR_MODULES.values())
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTR_MODULES.get(name, name if name in _LAZY_MODULES else None)
+    if module_name is None:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    module = importlib.import_module('.{}'.format(module_name), __name__)
+    value = getattr(module, name) if name in _LAZY_ATTR_MODULES else module
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTR_MODULES) | _LAZY_MODULES)
+
+
+if sys.version_info < (3, 7):
+    # Module-level `__getattr__` isn't supported (PEP 562), so import everything up front.
+    for _name in sorted(_LAZY_ATTR_MODULES):
+        __getattr__(_name)
+
+
+# `view` is imported eagerly (it's cheap), since importing the `daglet.view` submodule after the fact would otherwise
+# replace the function with the module.
 from .view import view
 (view)  # silence linter
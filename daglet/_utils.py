@@ -1,8 +1,15 @@
 from __future__ import unicode_literals
 
-from builtins import str
-from past.builtins import basestring
 import hashlib
+import sys
+
+
+if sys.version_info[0] >= 3:
+    basestring = str
+else:
+    # The `future`/`past` compatibility layers are comparatively slow to import, so only load them on python 2.
+    from builtins import str
+    from past.builtins import basestring
 
 
 def _recursive_repr(item):
@@ -0,0 +1,506 @@
+"""Distributed execution of :func:`daglet.transform` across worker processes.
+
+A coordinator (:func:`distributed_transform`) dispatches ready vertices to workers over TCP sockets
+(:mod:`multiprocessing.connection`, authenticated with a shared ``authkey``).  Each vertex is identified by its key
+(by default, the vertex hash for :class:`daglet.Vertex` objects, or else its index in topological order).  Workers
+keep the values they compute in a local cache and fetch the values of parent vertices directly from the peer worker
+that computed them, so values never pass through the coordinator until the final results are gathered.
+
+The coordinator pickles everything it sends to a worker with a single pickler, so the pickle memo is shared across
+messages: each object (and, for :class:`daglet.Vertex` objects, each ancestor) is only sent once per worker, and is
+just referenced after that.  Parents are sent by key and worker address; the parent objects themselves are only sent
+when a custom ``edge_func`` needs them.
+
+If a worker dies, the vertex it was running is retried on another worker, and any values that were only cached on the
+failed worker are recomputed.
+
+Workers can be started on other machines with ``python -m daglet.distributed --host HOST --port PORT`` (with the
+``DAGLET_AUTHKEY`` environment variable set) and used through a :class:`Cluster`, or a set of local worker processes
+can be started with :class:`LocalCluster`.
+
+Warning:
+    Objects, functions and values are exchanged with :mod:`pickle`; only run workers on trusted networks, and keep the
+    ``authkey`` secret.
+"""
+from __future__ import unicode_literals
+
+from builtins import object
+from builtins import range
+from collections import defaultdict
+from multiprocessing.connection import Client
+from multiprocessing.connection import Listener
+import argparse
+import daglet
+import heapq
+import io
+import multiprocessing
+import os
+import pickle
+import threading
+import traceback
+import uuid
+
+
+_CONNECTION_ERRORS = (EOFError, IOError, OSError)
+
+
+class WorkerFailedError(RuntimeError):
+    pass
+
+
+class _ParentFetchError(Exception):
+    def __init__(self, address):
+        super(_ParentFetchError, self).__init__('Failed to fetch parent value from {}'.format(address))
+        self.address = address
+
+
+class _MessageWriter(object):
+    """Sends messages over a connection with a shared pickle memo, so objects that were sent before are only
+    referenced.
+
+    The receiving end must read the messages with a :class:`_MessageReader`.
+    """
+    def __init__(self, conn):
+        self.__conn = conn
+        self.__file = io.BytesIO()
+        self.__pickler = pickle.Pickler(self.__file, pickle.HIGHEST_PROTOCOL)
+
+    def send(self, message):
+        self.__pickler.dump(message)
+        self.__conn.send_bytes(self.__file.getvalue())
+        self.__file.seek(0)
+        self.__file.truncate()
+
+
+class _MessageReader(object):
+    """Receives messages from a connection with a single unpickler, whose memo is kept across messages.
+
+    Messages sent by a :class:`_MessageWriter` can refer to objects from earlier messages; messages sent with
+    ``Connection.send`` are self-contained and can be read as well.
+    """
+    def __init__(self, conn):
+        self.__conn = conn
+        self.__buffer = b''
+        self.__offset = 0
+        self.__unpickler = pickle.Unpickler(self)
+
+    def recv(self):
+        return self.__unpickler.load()
+
+    def read(self, size=-1):
+        if self.__offset == len(self.__buffer):
+            self.__buffer = self.__conn.recv_bytes()
+            self.__offset = 0
+        end = len(self.__buffer) if size < 0 else self.__offset + size
+        data = self.__buffer[self.__offset:end]
+        self.__offset += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def readline(self):
+        if self.__offset == len(self.__buffer):
+            self.read(0)
+        end = self.__buffer.find(b'\n', self.__offset)
+        return self.read(len(self.__buffer) - self.__offset if end < 0 else end + 1 - self.__offset)
+
+
+class _Worker(object):
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+        self.__cache = {}
+        self.__lock = threading.Lock()
+        self.__idle_peer_conns = defaultdict(list)
+
+    def __get_peer_value(self, address, cache_key):
+        with self.__lock:
+            conns = self.__idle_peer_conns[address]
+            conn = conns.pop() if conns else None
+        try:
+            if conn is None:
+                conn = Client(address, authkey=self.authkey)
+            conn.send(('get', cache_key))
+            status, value = conn.recv()
+        except _CONNECTION_ERRORS:
+            raise _ParentFetchError(address)
+        if status != 'ok':
+            raise _ParentFetchError(address)
+        with self.__lock:
+            self.__idle_peer_conns[address].append(conn)
+        return value
+
+    def __get_value(self, address, cache_key):
+        if tuple(address) == tuple(self.address):
+            with self.__lock:
+                if cache_key not in self.__cache:
+                    raise _ParentFetchError(address)
+                return self.__cache[cache_key]
+        return self.__get_peer_value(address, cache_key)
+
+    def run(self, run_id, key, obj, vertex_func, edge_func, parents):
+        parent_values = []
+        for parent_key, address, parent_obj in parents:
+            parent_value = self.__get_value(address, (run_id, parent_key))
+            edge_value = edge_func(parent_obj, obj, parent_value)
+            parent_values.append(edge_value)
+            with self.__lock:
+                self.__cache[run_id, parent_key, key] = edge_value
+        value = vertex_func(obj, parent_values)
+        with self.__lock:
+            self.__cache[run_id, key] = value
+
+    def get(self, cache_key):
+        with self.__lock:
+            if cache_key not in self.__cache:
+                return 'missing', None
+            return 'ok', self.__cache[cache_key]
+
+    def collect(self, run_id):
+        """Return all values cached for ``run_id``."""
+        with self.__lock:
+            return {x[1:]: y for x, y in self.__cache.items() if x[0] == run_id}
+
+    def release(self, run_id):
+        """Forget all values cached for ``run_id``."""
+        with self.__lock:
+            for cache_key in [x for x in self.__cache if x[0] == run_id]:
+                del self.__cache[cache_key]
+
+    def handle(self, conn):
+        reader = _MessageReader(conn)
+        try:
+            while True:
+                message = reader.recv()
+                command = message[0]
+                if command == 'run':
+                    try:
+                        self.run(*message[1:])
+                        conn.send(('ok', None))
+                    except _ParentFetchError as e:
+                        conn.send(('fetch_error', e.address))
+                    except Exception as e:
+                        conn.send(('error', (e, traceback.format_exc())))
+                elif command == 'get':
+                    conn.send(self.get(message[1]))
+                elif command == 'collect':
+                    conn.send(('ok', self.collect(message[1])))
+                elif command == 'release':
+                    self.release(message[1])
+                    conn.send(('ok', None))
+                elif command == 'shutdown':
+                    conn.send(('ok', None))
+                    conn.close()
+                    os._exit(0)
+        except _CONNECTION_ERRORS:
+            pass
+        finally:
+            conn.close()
+
+
+def serve(address, authkey, ready_conn=None):
+    """Run a worker that listens on ``address`` (a ``(host, port)`` tuple) until it's told to shut down.
+
+    Args:
+        ready_conn: optional connection to send the actual listening address to once the worker is ready (useful with
+            port ``0``).
+    """
+    listener = Listener(tuple(address), authkey=authkey)
+    worker = _Worker(listener.address, authkey)
+    if ready_conn is not None:
+        ready_conn.send(listener.address)
+        ready_conn.close()
+    while True:
+        try:
+            conn = listener.accept()
+        except _CONNECTION_ERRORS:
+            # E.g. a failed authentication handshake.
+            continue
+        thread = threading.Thread(target=worker.handle, args=(conn,))
+        thread.daemon = True
+        thread.start()
+
+
+class Cluster(object):
+    """Set of worker addresses that share an ``authkey``."""
+    def __init__(self, addresses, authkey):
+        self.addresses = [tuple(x) for x in addresses]
+        self.authkey = authkey
+
+    def shutdown(self):
+        """Tell all reachable workers to exit."""
+        for address in self.addresses:
+            try:
+                conn = Client(address, authkey=self.authkey)
+                conn.send(('shutdown',))
+                conn.recv()
+                conn.close()
+            except _CONNECTION_ERRORS:
+                pass
+
+
+class LocalCluster(Cluster):
+    """Cluster of ``worker_count`` worker processes on localhost, for testing or single-machine use.
+
+    Example:
+        ```
+        with daglet.distributed.LocalCluster(4) as cluster:
+            vertex_map, edge_map = daglet.distributed.distributed_transform(objs, parent_func, vertex_func,
+                cluster=cluster)
+        ```
+    """
+    def __init__(self, worker_count, host='127.0.0.1'):
+        authkey = os.urandom(20)
+        self.processes = []
+        addresses = []
+        for _ in range(worker_count):
+            parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=serve, args=((host, 0), authkey, child_conn))
+            process.daemon = True
+            process.start()
+            child_conn.close()
+            addresses.append(parent_conn.recv())
+            parent_conn.close()
+            self.processes.append(process)
+        super(LocalCluster, self).__init__(addresses, authkey)
+
+    def kill(self, index):
+        """Terminate worker ``index`` (e.g. to simulate a node failure)."""
+        self.processes[index].terminate()
+        self.processes[index].join()
+
+    def close(self):
+        self.shutdown()
+        for process in self.processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def distributed_transform(objs, parent_func=None, vertex_func=None, edge_func=None, cluster=None, key_func=None,
+        max_retries=3):
+    """Like :func:`daglet.transform`, but evaluates vertices on the workers of ``cluster``.
+
+    ``vertex_func``, ``edge_func`` and the objects themselves are pickled and sent to the workers, so they must be
+    picklable (e.g. module-level functions).  ``parent_func`` is only called in the coordinator.
+
+    Args:
+        cluster: :class:`Cluster` (or :class:`LocalCluster`) to run on.
+        key_func: function that returns a unique, picklable key for each object.  By default, :class:`daglet.Vertex`
+            objects are keyed by their hash, and other objects by their index in topological order (since e.g.
+            ``hash(-1) == hash(-2)``, hashes of arbitrary objects aren't unique).
+        max_retries: how many times a vertex may be retried after the worker running it fails.
+
+    Returns:
+        ``(vertex_map, edge_map)`` tuple, as with :func:`daglet.transform`.
+
+    Raises:
+        ValueError: if ``key_func`` returns the same key for different objects.
+        WorkerFailedError: if a vertex fails more than ``max_retries`` times or every worker has failed.
+    """
+    if cluster is None:
+        raise TypeError('`cluster` must be specified')
+    parent_func = daglet._check_parent_func(objs, parent_func)
+    if vertex_func is None:
+        vertex_func = _return_none
+    # The default `edge_func` doesn't look at the parent objects, so there's no need to send them to the workers.
+    send_parent_objs = edge_func is not None
+    if edge_func is None:
+        edge_func = _return_parent_value
+
+    sorted_objs = daglet.toposort(objs, parent_func)
+    parent_map = {obj: list(parent_func(obj)) for obj in sorted_objs}
+    child_map = defaultdict(list)
+    for obj in sorted_objs:
+        for parent in parent_map[obj]:
+            child_map[parent].append(obj)
+    if key_func is None:
+        key_map = {
+            obj: hash(obj) if isinstance(obj, daglet.Vertex) else index
+            for index, obj in enumerate(sorted_objs)
+        }
+    else:
+        key_map = {obj: key_func(obj) for obj in sorted_objs}
+    obj_map = {key: obj for obj, key in key_map.items()}
+    if len(obj_map) != len(key_map):
+        raise ValueError('`key_func` returned the same key for different objects')
+    index_map = {obj: index for index, obj in enumerate(sorted_objs)}
+    run_id = uuid.uuid4().hex
+    addresses = cluster.addresses
+
+    condition = threading.Condition()
+    location_map = {}
+    running_objs = set()
+    missing_counts = {}
+    ready_heap = []
+    retry_counts = defaultdict(int)
+    alive_indexes = set(range(len(addresses)))
+    state = {'error': None}
+
+    def reset_ready():
+        # Must be called with `condition` held.
+        del ready_heap[:]
+        for obj in sorted_objs:
+            missing_counts[obj] = sum(1 for x in parent_map[obj] if x not in location_map)
+            if not missing_counts[obj] and obj not in location_map and obj not in running_objs:
+                ready_heap.append((index_map[obj], obj))
+        heapq.heapify(ready_heap)
+
+    def is_finished():
+        return state['error'] is not None or len(location_map) == len(sorted_objs) or not alive_indexes
+
+    def fail_worker(worker_index):
+        # Must be called with `condition` held.
+        if worker_index in alive_indexes:
+            alive_indexes.discard(worker_index)
+            for obj in [x for x, y in location_map.items() if y == worker_index]:
+                del location_map[obj]
+            reset_ready()
+            if not alive_indexes and state['error'] is None:
+                state['error'] = WorkerFailedError('All workers failed')
+        condition.notify_all()
+
+    def retry(obj):
+        # Must be called with `condition` held.
+        running_objs.discard(obj)
+        retry_counts[obj] += 1
+        if retry_counts[obj] > max_retries and state['error'] is None:
+            state['error'] = WorkerFailedError('Giving up on {} after {} retries'.format(obj, max_retries))
+        reset_ready()
+        condition.notify_all()
+
+    def finish(obj, worker_index):
+        # Must be called with `condition` held.
+        running_objs.discard(obj)
+        location_map[obj] = worker_index
+        for child in child_map[obj]:
+            missing_counts[child] -= 1
+            if not missing_counts[child] and child not in location_map and child not in running_objs:
+                heapq.heappush(ready_heap, (index_map[child], child))
+        condition.notify_all()
+
+    def run_worker(worker_index):
+        try:
+            conn = Client(addresses[worker_index], authkey=cluster.authkey)
+            writer = _MessageWriter(conn)
+        except _CONNECTION_ERRORS:
+            with condition:
+                fail_worker(worker_index)
+            return
+        try:
+            while True:
+                with condition:
+                    while not ready_heap and not is_finished() and worker_index in alive_indexes:
+                        condition.wait()
+                    if is_finished() or worker_index not in alive_indexes:
+                        return
+                    _, obj = heapq.heappop(ready_heap)
+                    running_objs.add(obj)
+                    parents = [
+                        (key_map[x], addresses[location_map[x]], x if send_parent_objs else None)
+                        for x in parent_map[obj]
+                    ]
+                try:
+                    writer.send(('run', run_id, key_map[obj], obj, vertex_func, edge_func, parents))
+                    status, result = conn.recv()
+                except _CONNECTION_ERRORS:
+                    with condition:
+                        fail_worker(worker_index)
+                        retry(obj)
+                    return
+                with condition:
+                    if status == 'ok' and worker_index not in alive_indexes:
+                        # The worker was marked dead (e.g. by a peer's fetch error) while computing `obj`, so its
+                        # result can't be fetched from there.
+                        retry(obj)
+                    elif status == 'ok':
+                        finish(obj, worker_index)
+                    elif status == 'fetch_error':
+                        peer_index = addresses.index(tuple(result))
+                        fail_worker(peer_index)
+                        retry(obj)
+                    else:
+                        running_objs.discard(obj)
+                        if state['error'] is None:
+                            state['error'] = result[0]
+                        condition.notify_all()
+                        return
+        finally:
+            conn.close()
+
+    while True:
+        with condition:
+            reset_ready()
+        threads = [threading.Thread(target=run_worker, args=(x,)) for x in sorted(alive_indexes)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if state['error'] is None:
+            results = _send_all(cluster, alive_indexes, ('collect', run_id))
+            with condition:
+                for worker_index in [x for x, y in results.items() if y is None]:
+                    fail_worker(worker_index)
+        if state['error'] is not None or len(location_map) == len(sorted_objs):
+            break
+    _send_all(cluster, alive_indexes, ('release', run_id))
+    if state['error'] is not None:
+        raise state['error']
+
+    vertex_map = {}
+    edge_map = {}
+    for worker_results in [x for x in results.values() if x is not None]:
+        for cache_key, value in worker_results.items():
+            if len(cache_key) == 1:
+                vertex_map[obj_map[cache_key[0]]] = value
+            else:
+                edge_map[obj_map[cache_key[0]], obj_map[cache_key[1]]] = value
+    return vertex_map, edge_map
+
+
+def _return_none(obj, parent_values):
+    return None
+
+
+def _return_parent_value(parent_obj, obj, parent_value):
+    return parent_value
+
+
+def _send_all(cluster, worker_indexes, message):
+    """Send ``message`` to each worker and return the results; workers that can't be reached map to ``None``."""
+    results = {}
+    for worker_index in sorted(worker_indexes):
+        try:
+            conn = Client(cluster.addresses[worker_index], authkey=cluster.authkey)
+            conn.send(message)
+            _, results[worker_index] = conn.recv()
+            conn.close()
+        except _CONNECTION_ERRORS:
+            results[worker_index] = None
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a daglet distributed worker.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0)
+    args = parser.parse_args()
+    authkey = os.environ.get('DAGLET_AUTHKEY')
+    if not authkey:
+        parser.error('the DAGLET_AUTHKEY environment variable must be set')
+    serve((args.host, args.port), authkey.encode())
+
+
+if __name__ == '__main__':
+    main()
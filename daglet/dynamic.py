@@ -0,0 +1,127 @@
+from __future__ import unicode_literals
+
+from builtins import object
+import daglet
+
+
+class DynamicDag(object):
+    """Mutable DAG that maintains a topological order as vertices and edges are inserted.
+
+    The order is maintained incrementally with the Pearce-Kelly algorithm: inserting an edge that already agrees with
+    the current order is O(1), and otherwise only the vertices between the edge's endpoints in the current order that
+    are connected to them (the "affected region") are visited and reordered.  This keeps the cost of streaming edge
+    insertion roughly proportional to the size of the affected region rather than the size of the whole graph, which
+    is what re-running :func:`daglet.toposort` after every insertion would cost.
+
+    Vertices can be any hashable objects.  The graph can be passed to other daglet functions by using
+    :meth:`get_parents` as the ``parent_func``.
+
+    Example:
+        ```
+        dag = daglet.DynamicDag()
+        dag.add_edge('b', 'c')
+        dag.add_edge('a', 'b')
+        assert dag.order == ['a', 'b', 'c']
+        ```
+    """
+    def __init__(self, objs=[], parent_func=None):
+        self.__parent_map = {}
+        self.__child_map = {}
+        self.__index_map = {}
+        self.__order = []
+        if objs:
+            parent_func = daglet._check_parent_func(objs, parent_func)
+            for obj in daglet.toposort(objs, parent_func):
+                self.add_vertex(obj)
+                for parent in parent_func(obj):
+                    self.add_edge(parent, obj)
+
+    @property
+    def order(self):
+        """List of all vertices in topological order."""
+        return list(self.__order)
+
+    def __len__(self):
+        return len(self.__order)
+
+    def __iter__(self):
+        return iter(list(self.__order))
+
+    def __contains__(self, obj):
+        return obj in self.__index_map
+
+    def index(self, obj):
+        """Position of ``obj`` in the current topological order."""
+        return self.__index_map[obj]
+
+    def get_parents(self, obj):
+        return list(self.__parent_map[obj])
+
+    def get_children(self, obj):
+        return list(self.__child_map[obj])
+
+    def has_edge(self, parent, child):
+        return parent in self.__parent_map.get(child, [])
+
+    def add_vertex(self, obj):
+        """Add a vertex (if it doesn't already exist) at the end of the topological order."""
+        if obj not in self.__index_map:
+            self.__parent_map[obj] = []
+            self.__child_map[obj] = []
+            self.__index_map[obj] = len(self.__order)
+            self.__order.append(obj)
+
+    def __search(self, start, next_map, is_in_region, target):
+        found_objs = set([start])
+        stack = [start]
+        while stack:
+            obj = stack.pop()
+            for next_obj in next_map[obj]:
+                if next_obj == target:
+                    return None
+                if next_obj not in found_objs and is_in_region(self.__index_map[next_obj]):
+                    found_objs.add(next_obj)
+                    stack.append(next_obj)
+        return found_objs
+
+    def add_edge(self, parent, child):
+        """Add a ``parent -> child`` edge, adding either vertex if it doesn't already exist.
+
+        Returns:
+            List of vertices that were reordered to accommodate the edge (the affected region), in their new order.
+            The list is empty if the existing order was already consistent with the edge.
+
+        Raises:
+            RuntimeError: if the edge would create a cycle; the graph is left unchanged.
+        """
+        if parent == child:
+            raise RuntimeError('Graph is not a DAG; edge {} -> {} would create a cycle'.format(parent, child))
+        self.add_vertex(parent)
+        self.add_vertex(child)
+        if self.has_edge(parent, child):
+            return []
+
+        lower_bound = self.__index_map[child]
+        upper_bound = self.__index_map[parent]
+        affected_objs = []
+        if lower_bound < upper_bound:
+            forward_objs = self.__search(child, self.__child_map, lambda x: x < upper_bound, parent)
+            if forward_objs is None:
+                raise RuntimeError('Graph is not a DAG; edge {} -> {} would create a cycle'.format(parent, child))
+            backward_objs = self.__search(parent, self.__parent_map, lambda x: x > lower_bound, child)
+            affected_objs = self.__reorder(backward_objs, forward_objs)
+
+        self.__parent_map[child].append(parent)
+        self.__child_map[parent].append(child)
+        return affected_objs
+
+    def __reorder(self, backward_objs, forward_objs):
+        # Reuse the affected vertices' existing positions, placing everything that leads to the new edge's parent
+        # ahead of everything reachable from its child; relative order within each group is preserved.
+        index_key = self.__index_map.__getitem__
+        affected_objs = sorted(backward_objs, key=index_key) + sorted(forward_objs, key=index_key)
+        indexes = sorted(self.__index_map[x] for x in affected_objs)
+        for index, obj in zip(indexes, affected_objs):
+            self.__index_map[obj] = index
+            self.__order[index] = obj
+        return affected_objs
@@ -0,0 +1,199 @@
+"""Partitioning of DAGs into balanced, acyclic parts with few cut edges."""
+from __future__ import unicode_literals
+
+from builtins import object
+from builtins import range
+import daglet
+
+
+class Partitioning(object):
+    """Result of :func:`partition`.
+
+    Attributes:
+        parts: list of ``k`` lists of objects, each in topological order.  Every edge goes from a part to the same or a
+            later part, so the parts themselves form a DAG and can be run in order (or in parallel where independent).
+        part_map: dictionary mapping each object to the index of its part.
+        part_costs: total cost of each part.
+        cut_edges: list of ``(parent, child)`` edges whose endpoints are in different parts.
+    """
+    def __init__(self, parts, part_map, part_costs, cut_edges):
+        self.parts = parts
+        self.part_map = part_map
+        self.part_costs = part_costs
+        self.cut_edges = cut_edges
+
+    @property
+    def cut_edge_count(self):
+        return len(self.cut_edges)
+
+    @property
+    def balance(self):
+        """Ratio of the most expensive part's cost to the average part cost (``1.0`` is perfectly balanced)."""
+        total_cost = sum(self.part_costs)
+        if not total_cost:
+            return 1.
+        return max(self.part_costs) / (float(total_cost) / len(self.part_costs))
+
+    def get_part_parent_map(self):
+        """Dictionary mapping each part index to the sorted list of part indexes it depends on."""
+        part_parent_map = {x: set() for x in range(len(self.parts))}
+        for parent, child in self.cut_edges:
+            part_parent_map[self.part_map[child]].add(self.part_map[parent])
+        return {x: sorted(y) for x, y in part_parent_map.items()}
+
+    def __repr__(self):
+        return 'daglet.Partitioning(part_count={}, cut_edge_count={}, balance={:.3f})'.format(len(self.parts),
+            self.cut_edge_count, self.balance)
+
+
+def _get_initial_boundaries(costs, k):
+    # `boundaries[i]` is the index (in topological order) of the first vertex of part `i`, and `boundaries[k]` is the
+    # vertex count.
+    total_cost = float(sum(costs))
+    boundaries = [0]
+    cumulative_cost = 0.
+    for index, cost in enumerate(costs):
+        part_index = len(boundaries)
+        if (part_index < k and index > boundaries[-1] and
+                cumulative_cost + cost / 2. > total_cost * part_index / k):
+            boundaries.append(index)
+        cumulative_cost += cost
+    while len(boundaries) < k:
+        boundaries.append(len(costs))
+    boundaries.append(len(costs))
+    return boundaries
+
+
+def _refine_boundary(boundaries, part_index, part_indexes, neighbor_indexes, costs, part_costs, max_cost):
+    """Move the boundary between parts ``part_index`` and ``part_index + 1`` to where it cuts the fewest edges."""
+    start = boundaries[part_index]
+    boundary = boundaries[part_index + 1]
+    end = boundaries[part_index + 2]
+    if end - start < 2:
+        return False
+
+    def get_move_delta(index, from_part_index, to_part_index):
+        delta = 0
+        for neighbor_index in neighbor_indexes[index]:
+            neighbor_part_index = part_indexes[neighbor_index]
+            if neighbor_part_index == from_part_index:
+                delta += 1
+            elif neighbor_part_index == to_part_index:
+                delta -= 1
+        return delta
+
+    best_delta = 0
+    best_boundary = boundary
+    left_cost, right_cost = part_costs[part_index], part_costs[part_index + 1]
+
+    # Try moving the boundary left, i.e. moving vertices from the end of the left part into the right part.
+    delta = 0
+    new_boundary = boundary
+    moved_indexes = []
+    while new_boundary - 1 > start:
+        index = new_boundary - 1
+        if right_cost + costs[index] > max_cost:
+            break
+        delta += get_move_delta(index, part_index, part_index + 1)
+        part_indexes[index] = part_index + 1
+        moved_indexes.append(index)
+        left_cost -= costs[index]
+        right_cost += costs[index]
+        new_boundary = index
+        if delta < best_delta:
+            best_delta, best_boundary = delta, new_boundary
+    for index in moved_indexes:
+        part_indexes[index] = part_index
+
+    # Try moving the boundary right.
+    left_cost, right_cost = part_costs[part_index], part_costs[part_index + 1]
+    delta = 0
+    new_boundary = boundary
+    moved_indexes = []
+    while new_boundary + 1 < end:
+        index = new_boundary
+        if left_cost + costs[index] > max_cost:
+            break
+        delta += get_move_delta(index, part_index + 1, part_index)
+        part_indexes[index] = part_index
+        moved_indexes.append(index)
+        left_cost += costs[index]
+        right_cost -= costs[index]
+        new_boundary = index + 1
+        if delta < best_delta:
+            best_delta, best_boundary = delta, new_boundary
+    for index in moved_indexes:
+        part_indexes[index] = part_index + 1
+
+    if best_boundary == boundary:
+        return False
+    for index in range(min(boundary, best_boundary), max(boundary, best_boundary)):
+        part_indexes[index] = part_index if index < best_boundary else part_index + 1
+    moved_cost = sum(costs[min(boundary, best_boundary):max(boundary, best_boundary)])
+    if best_boundary < boundary:
+        part_costs[part_index] -= moved_cost
+        part_costs[part_index + 1] += moved_cost
+    else:
+        part_costs[part_index] += moved_cost
+        part_costs[part_index + 1] -= moved_cost
+    boundaries[part_index + 1] = best_boundary
+    return True
+
+
+def partition(objs, parent_func=None, k=2, cost_func=None, epsilon=0.05, max_passes=4):
+    """Split a DAG into ``k`` acyclic parts of similar cost, with few edges between parts.
+
+    The vertices are laid out in depth-first topological order (which keeps connected vertices close together) and
+    cut into ``k`` contiguous ranges of roughly equal cost.  Because each part is a contiguous range of a topological
+    order, the parts are guaranteed to be acyclic with respect to each other.  The boundaries between neighboring
+    parts are then moved to wherever they cut the fewest edges, as long as no part's cost exceeds the average by more
+    than ``epsilon`` (or the initial split's maximum, if that's higher).
+
+    Args:
+        k: number of parts.
+        cost_func: function that returns the cost of a vertex; defaults to ``1`` each, i.e. balancing by vertex count.
+        epsilon: allowed imbalance, as a fraction of the average part cost.
+        max_passes: maximum number of refinement passes over the part boundaries.
+
+    Returns:
+        :class:`Partitioning`.
+    """
+    parent_func = daglet._check_parent_func(objs, parent_func)
+    if k < 1:
+        raise ValueError('Expected `k` to be at least 1; got {}'.format(k))
+    if cost_func is None:
+        cost_func = lambda obj: 1
+    sorted_objs = daglet.toposort(objs, parent_func)
+    index_map = {obj: index for index, obj in enumerate(sorted_objs)}
+    costs = [cost_func(obj) for obj in sorted_objs]
+    edges = [(index_map[parent], index) for index, obj in enumerate(sorted_objs) for parent in parent_func(obj)]
+    neighbor_indexes = [[] for _ in sorted_objs]
+    for parent_index, child_index in edges:
+        neighbor_indexes[parent_index].append(child_index)
+        neighbor_indexes[child_index].append(parent_index)
+
+    boundaries = _get_initial_boundaries(costs, k)
+    part_indexes = [None] * len(sorted_objs)
+    part_costs = []
+    for part_index in range(k):
+        for index in range(boundaries[part_index], boundaries[part_index + 1]):
+            part_indexes[index] = part_index
+        part_costs.append(sum(costs[boundaries[part_index]:boundaries[part_index + 1]]))
+    max_cost = max([(1. + epsilon) * sum(costs) / k] + part_costs)
+
+    for _ in range(max_passes):
+        changed = False
+        for part_index in range(k - 1):
+            changed |= _refine_boundary(boundaries, part_index, part_indexes, neighbor_indexes, costs, part_costs,
+                max_cost)
+        if not changed:
+            break
+
+    parts = [sorted_objs[boundaries[x]:boundaries[x + 1]] for x in range(k)]
+    part_map = {obj: part_indexes[index] for index, obj in enumerate(sorted_objs)}
+    cut_edges = [
+        (sorted_objs[parent_index], sorted_objs[child_index])
+        for parent_index, child_index in edges
+        if part_indexes[parent_index] != part_indexes[child_index]
+    ]
+    return Partitioning(parts, part_map, part_costs, cut_edges)
@@ -0,0 +1,234 @@
+"""Cost-aware parallel execution of :func:`daglet.transform`.
+
+Ready vertices are prioritized by their upward rank (the cost of the most expensive path from the vertex down to any
+sink, including the vertex itself), as in HEFT-style list scheduling.  Running the critical path first keeps long
+chains from holding up the whole graph while workers sit idle.
+"""
+from __future__ import unicode_literals
+
+from builtins import object
+from collections import defaultdict
+import daglet
+import heapq
+import threading
+import time
+
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class CostModel(object):
+    """Per-vertex cost estimates learned from earlier timed runs.
+
+    Costs are tracked by ``key_func(obj)`` (the object itself by default), so that e.g. vertices with the same kind of
+    label can share an estimate.  Each recorded duration is blended into the running estimate with an exponential
+    moving average.
+
+    A cost model can be used directly as a ``cost_func``, and is updated automatically when passed to
+    :func:`parallel_transform` as ``cost_model``.
+    """
+    def __init__(self, key_func=None, default_cost=1., smoothing=0.5):
+        self.key_func = key_func if key_func is not None else lambda x: x
+        self.default_cost = default_cost
+        self.smoothing = smoothing
+        self.__costs = {}
+        self.__lock = threading.Lock()
+
+    def get_cost(self, obj):
+        return self.__costs.get(self.key_func(obj), self.default_cost)
+
+    def record(self, obj, duration):
+        key = self.key_func(obj)
+        with self.__lock:
+            old_cost = self.__costs.get(key)
+            if old_cost is None:
+                self.__costs[key] = duration
+            else:
+                self.__costs[key] = self.smoothing * duration + (1. - self.smoothing) * old_cost
+
+    def __call__(self, obj):
+        return self.get_cost(obj)
+
+
+class ScheduleReport(object):
+    """Timing information from a :func:`parallel_transform` run."""
+    def __init__(self, worker_count, predicted_makespan, actual_makespan, rank_map, duration_map):
+        self.worker_count = worker_count
+        self.predicted_makespan = predicted_makespan
+        self.actual_makespan = actual_makespan
+        self.rank_map = rank_map
+        self.duration_map = duration_map
+
+    def __repr__(self):
+        return 'daglet.ScheduleReport(worker_count={}, predicted_makespan={:.6g}, actual_makespan={:.6g})'.format(
+            self.worker_count, self.predicted_makespan, self.actual_makespan)
+
+
+def get_upward_ranks(objs, parent_func=None, cost_func=None):
+    """Compute the upward rank of each vertex: its cost plus the highest upward rank among its children.
+
+    Args:
+        cost_func: function that returns the estimated cost of running a vertex; defaults to a cost of ``1`` each, in
+            which case the rank is the length of the longest path to a sink.
+    """
+    parent_func = daglet._check_parent_func(objs, parent_func)
+    if cost_func is None:
+        cost_func = lambda obj: 1.
+    sorted_objs = daglet.toposort(objs, parent_func)
+    child_map = daglet.get_child_map(objs, parent_func)
+    rank_map = {}
+    for obj in reversed(sorted_objs):
+        child_ranks = [rank_map[x] for x in child_map.get(obj, [])]
+        rank_map[obj] = cost_func(obj) + max(child_ranks or [0.])
+    return rank_map
+
+
+def predict_makespan(objs, parent_func=None, cost_func=None, worker_count=1, rank_map=None):
+    """Simulate rank-prioritized list scheduling on ``worker_count`` workers and return the predicted makespan."""
+    parent_func = daglet._check_parent_func(objs, parent_func)
+    if cost_func is None:
+        cost_func = lambda obj: 1.
+    if rank_map is None:
+        rank_map = get_upward_ranks(objs, parent_func, cost_func)
+    sorted_objs = daglet.toposort(objs, parent_func)
+    child_map = defaultdict(list)
+    remaining_counts = {}
+    for obj in sorted_objs:
+        parent_objs = parent_func(obj)
+        remaining_counts[obj] = len(parent_objs)
+        for parent_obj in parent_objs:
+            child_map[parent_obj].append(obj)
+
+    ready_heap = []
+    for index, obj in enumerate(sorted_objs):
+        if remaining_counts[obj] == 0:
+            heapq.heappush(ready_heap, (-rank_map[obj], index, obj))
+    index_map = {obj: index for index, obj in enumerate(sorted_objs)}
+    running_heap = []
+    now = 0.
+    idle_worker_count = worker_count
+    while ready_heap or running_heap:
+        while ready_heap and idle_worker_count:
+            _, index, obj = heapq.heappop(ready_heap)
+            heapq.heappush(running_heap, (now + cost_func(obj), index, obj))
+            idle_worker_count -= 1
+        now, _, obj = heapq.heappop(running_heap)
+        idle_worker_count += 1
+        for child in child_map[obj]:
+            remaining_counts[child] -= 1
+            if remaining_counts[child] == 0:
+                heapq.heappush(ready_heap, (-rank_map[child], index_map[child], child))
+    return now
+
+
+def parallel_transform(objs, parent_func=None, vertex_func=None, edge_func=None, vertex_map={}, worker_count=4,
+        cost_func=None, cost_model=None):
+    """Like :func:`daglet.transform`, but runs ``vertex_func`` on a pool of ``worker_count`` threads.
+
+    Whenever a worker is free, it picks the ready vertex with the highest upward rank (see
+    :func:`get_upward_ranks`), so that vertices on the critical path run first.
+
+    Args:
+        cost_func: function that returns the estimated cost of a vertex (e.g. in seconds).  Defaults to
+            ``cost_model`` if specified, or else a cost of ``1`` for every vertex.
+        cost_model: optional :class:`CostModel`; the measured duration of each ``vertex_func`` call is recorded into
+            it, so that later runs can be scheduled with learned costs.
+
+    Returns:
+        ``(vertex_map, edge_map, report)`` tuple, where ``vertex_map`` and ``edge_map`` are the same as for
+        :func:`daglet.transform` and ``report`` is a :class:`ScheduleReport` with the predicted and actual makespan.
+    """
+    parent_func = daglet._check_parent_func(objs, parent_func)
+    if vertex_func is None:
+        vertex_func = lambda obj, parent_values: None
+    if vertex_map is not None:
+        old_parent_func = parent_func
+        parent_func = lambda x: old_parent_func(x) if x not in vertex_map else []
+    if edge_func is None:
+        edge_func = lambda parent_obj, obj, parent_value: parent_value
+    if cost_func is None:
+        cost_func = cost_model if cost_model is not None else lambda obj: 1.
+    if worker_count < 1:
+        raise ValueError('Expected `worker_count` to be at least 1; got {}'.format(worker_count))
+
+    sorted_objs = daglet.toposort(objs, parent_func)
+    parent_map = {obj: list(parent_func(obj)) for obj in sorted_objs}
+    child_map = defaultdict(list)
+    for obj in sorted_objs:
+        for parent in parent_map[obj]:
+            child_map[parent].append(obj)
+    estimate_func = lambda obj: 0. if obj in vertex_map else cost_func(obj)
+    rank_map = get_upward_ranks(objs, parent_map.__getitem__, estimate_func)
+    predicted_makespan = predict_makespan(objs, parent_map.__getitem__, estimate_func, worker_count, rank_map)
+
+    new_vertex_map = {}
+    new_edge_map = {}
+    duration_map = {}
+    remaining_counts = {obj: len(parent_map[obj]) for obj in sorted_objs}
+    index_map = {obj: index for index, obj in enumerate(sorted_objs)}
+    ready_heap = []
+    state = {'pending_count': len(sorted_objs), 'error': None}
+    condition = threading.Condition()
+
+    def finish(obj, value):
+        # Must be called with `condition` held.
+        new_vertex_map[obj] = value
+        state['pending_count'] -= 1
+        for child in child_map[obj]:
+            remaining_counts[child] -= 1
+            if remaining_counts[child] == 0:
+                heapq.heappush(ready_heap, (-rank_map[child], index_map[child], child))
+        condition.notify_all()
+
+    def run_worker():
+        while True:
+            with condition:
+                while not ready_heap and state['pending_count'] and state['error'] is None:
+                    condition.wait()
+                if not state['pending_count'] or state['error'] is not None:
+                    return
+                _, _, obj = heapq.heappop(ready_heap)
+                parent_values = [(x, new_vertex_map[x]) for x in parent_map[obj]]
+            try:
+                if obj in vertex_map:
+                    value = vertex_map[obj]
+                else:
+                    edge_values = []
+                    for parent_obj, parent_value in parent_values:
+                        edge_value = edge_func(parent_obj, obj, parent_value)
+                        edge_values.append(edge_value)
+                        with condition:
+                            new_edge_map[parent_obj, obj] = edge_value
+                    start_time = _clock()
+                    value = vertex_func(obj, edge_values)
+                    duration = _clock() - start_time
+                    duration_map[obj] = duration
+                    if cost_model is not None:
+                        cost_model.record(obj, duration)
+            except Exception as e:
+                with condition:
+                    if state['error'] is None:
+                        state['error'] = e
+                    condition.notify_all()
+                return
+            with condition:
+                finish(obj, value)
+
+    with condition:
+        for obj in sorted_objs:
+            if remaining_counts[obj] == 0:
+                heapq.heappush(ready_heap, (-rank_map[obj], index_map[obj], obj))
+
+    start_time = _clock()
+    threads = [threading.Thread(target=run_worker) for _ in range(min(worker_count, len(sorted_objs)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    actual_makespan = _clock() - start_time
+    if state['error'] is not None:
+        raise state['error']
+
+    report = ScheduleReport(worker_count, predicted_makespan, actual_makespan, rank_map, duration_map)
+    return new_vertex_map, new_edge_map, report
@@ -0,0 +1,240 @@
+"""Compact binary serialization of :class:`daglet.Vertex` graphs.
+
+File layout (all integers are little-endian):
+    - header: magic, vertex count, parent-edge count, root count, object count
+    - vertex hashes (int64 per vertex)
+    - label indexes (int32 per vertex, index into the object table)
+    - extra_hash indexes (int32 per vertex, index into the object table)
+    - flags (uint8 per vertex; bit 0 is set for vertices with ``lazy_hash``)
+    - parent offsets (uint64 per vertex, plus one; parents of vertex ``i`` are entries ``offsets[i]:offsets[i+1]``)
+    - parent indexes (uint32 per parent edge, index into the vertex table)
+    - root indexes (uint32 per root)
+    - object offsets (uint64 per object, plus one; object ``i`` is pickled in ``data[offsets[i]:offsets[i+1]]``)
+    - object data (each distinct label/extra_hash value, pickled separately so it can be unpickled on demand)
+
+Vertices are stored in topological order, so each vertex only refers to vertices that come before it.  Structurally
+equal vertices are only stored once, and the stored hashes are restored as-is on load rather than recomputed.  Labels
+and extra_hash values are only unpickled once a vertex that uses them is materialized.
+"""
+from __future__ import unicode_literals
+
+from builtins import object
+import daglet
+import mmap
+import pickle
+import struct
+
+
+_MAGIC = b'DAGLET02'
+_HEADER = struct.Struct(str('<8sQQQQ'))
+_HASH = struct.Struct(str('<q'))
+_OBJECT_INDEX = struct.Struct(str('<i'))
+_PARENT_OFFSET = struct.Struct(str('<Q'))
+_OBJECT_OFFSET = struct.Struct(str('<Q'))
+_VERTEX_INDEX = struct.Struct(str('<I'))
+_FLAGS = struct.Struct(str('<B'))
+_LAZY_HASH_FLAG = 1
+
+
+def _pack_array(struct_, values):
+    typecode = struct_.format[-1:]
+    if isinstance(typecode, bytes):
+        typecode = typecode.decode()
+    return struct.pack(str('<{}{}').format(len(values), typecode), *values)
+
+
+class _ObjectTable(object):
+    """Deduplicating table of labels and extra_hash values."""
+    def __init__(self):
+        self.pickles = []
+        self.__index_map = {}
+
+    def add(self, obj):
+        # Deduplicate on the pickled representation rather than on equality, since values that compare equal (e.g.
+        # ``1`` and ``True``, or ``0.0`` and ``-0.0``) can still contribute differently to vertex hashes.
+        data = pickle.dumps(obj, protocol=2)
+        index = self.__index_map.get(data)
+        if index is None:
+            index = len(self.pickles)
+            self.__index_map[data] = index
+            self.pickles.append(data)
+        return index
+
+
+def dump(vertices, file):
+    """Write the graph reachable from ``vertices`` to ``file`` in daglet's binary format.
+
+    Args:
+        vertices: root :class:`daglet.Vertex` objects; every ancestor is written as well.
+        file: path or writable binary file object.
+    """
+    if not hasattr(file, 'write'):
+        with open(file, 'wb') as f:
+            return dump(vertices, f)
+
+    vertices = list(vertices)
+    for vertex in vertices:
+        if not isinstance(vertex, daglet.Vertex):
+            raise TypeError('Expected Vertex instance; got {}'.format(vertex))
+    sorted_vertices, index_map = daglet._flatten_vertices(vertices)
+
+    object_table = _ObjectTable()
+    hashes = []
+    label_indexes = []
+    extra_hash_indexes = []
+    flags = []
+    parent_offsets = [0]
+    parent_indexes = []
+    for vertex in sorted_vertices:
+        hashes.append(hash(vertex))
+        label_indexes.append(object_table.add(vertex.label))
+        extra_hash_indexes.append(object_table.add(vertex.extra_hash))
+        flags.append(_LAZY_HASH_FLAG if vertex.lazy_hash else 0)
+        parent_indexes += [index_map[x] for x in vertex.parents]
+        parent_offsets.append(len(parent_indexes))
+    root_indexes = [index_map[x] for x in vertices]
+    object_offsets = [0]
+    for data in object_table.pickles:
+        object_offsets.append(object_offsets[-1] + len(data))
+
+    file.write(_HEADER.pack(_MAGIC, len(sorted_vertices), len(parent_indexes), len(root_indexes),
+        len(object_table.pickles)))
+    file.write(_pack_array(_HASH, hashes))
+    file.write(_pack_array(_OBJECT_INDEX, label_indexes))
+    file.write(_pack_array(_OBJECT_INDEX, extra_hash_indexes))
+    file.write(_pack_array(_FLAGS, flags))
+    file.write(_pack_array(_PARENT_OFFSET, parent_offsets))
+    file.write(_pack_array(_VERTEX_INDEX, parent_indexes))
+    file.write(_pack_array(_VERTEX_INDEX, root_indexes))
+    file.write(_pack_array(_OBJECT_OFFSET, object_offsets))
+    for data in object_table.pickles:
+        file.write(data)
+
+
+class VertexFile(object):
+    """Vertex graph loaded with :func:`load`.
+
+    Behaves as a sequence of the stored vertices in topological order.  Vertices are materialized lazily on access
+    (along with their ancestors) and then cached, and so are the labels and extra_hash values they use.
+    """
+    def __init__(self, buffer, close_func=None):
+        self.__buffer = buffer
+        self.__close_func = close_func
+        magic, vertex_count, parent_count, root_count, object_count = _HEADER.unpack_from(buffer, 0)
+        if magic != _MAGIC:
+            raise ValueError('Not a daglet graph file (bad magic: {!r})'.format(magic))
+        self.__hashes_offset = _HEADER.size
+        self.__label_indexes_offset = self.__hashes_offset + vertex_count * _HASH.size
+        self.__extra_hash_indexes_offset = self.__label_indexes_offset + vertex_count * _OBJECT_INDEX.size
+        self.__flags_offset = self.__extra_hash_indexes_offset + vertex_count * _OBJECT_INDEX.size
+        self.__parent_offsets_offset = self.__flags_offset + vertex_count * _FLAGS.size
+        self.__parent_indexes_offset = self.__parent_offsets_offset + (vertex_count + 1) * _PARENT_OFFSET.size
+        self.__root_indexes_offset = self.__parent_indexes_offset + parent_count * _VERTEX_INDEX.size
+        self.__object_offsets_offset = self.__root_indexes_offset + root_count * _VERTEX_INDEX.size
+        self.__object_data_offset = self.__object_offsets_offset + (object_count + 1) * _OBJECT_OFFSET.size
+        self.__objects = {}
+        self.__root_count = root_count
+        self.__vertices = [None] * vertex_count
+
+    def __len__(self):
+        return len(self.__vertices)
+
+    def __get_parent_indexes(self, index):
+        start, end = [
+            _PARENT_OFFSET.unpack_from(self.__buffer, self.__parent_offsets_offset + i * _PARENT_OFFSET.size)[0]
+            for i in (index, index + 1)
+        ]
+        return [
+            _VERTEX_INDEX.unpack_from(self.__buffer, self.__parent_indexes_offset + i * _VERTEX_INDEX.size)[0]
+            for i in range(start, end)
+        ]
+
+    def __get_object(self, index):
+        if index not in self.__objects:
+            start, end = [
+                _OBJECT_OFFSET.unpack_from(self.__buffer, self.__object_offsets_offset + i * _OBJECT_OFFSET.size)[0]
+                for i in (index, index + 1)
+            ]
+            data = self.__buffer[self.__object_data_offset + start:self.__object_data_offset + end]
+            self.__objects[index] = pickle.loads(bytes(data))
+        return self.__objects[index]
+
+    def __materialize(self, index):
+        buffer = self.__buffer
+        hash_ = _HASH.unpack_from(buffer, self.__hashes_offset + index * _HASH.size)[0]
+        label_index = _OBJECT_INDEX.unpack_from(buffer, self.__label_indexes_offset + index * _OBJECT_INDEX.size)[0]
+        extra_hash_index = _OBJECT_INDEX.unpack_from(buffer,
+            self.__extra_hash_indexes_offset + index * _OBJECT_INDEX.size)[0]
+        flags = _FLAGS.unpack_from(buffer, self.__flags_offset + index * _FLAGS.size)[0]
+        parents = [self.__vertices[x] for x in self.__get_parent_indexes(index)]
+        return daglet.Vertex._create(self.__get_object(label_index), parents, self.__get_object(extra_hash_index),
+            bool(flags & _LAZY_HASH_FLAG), hash_)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('vertex index out of range')
+        # Materialize unloaded ancestors post-order with an explicit stack to support deep graphs.
+        stack = [index]
+        while stack:
+            index2 = stack[-1]
+            if self.__vertices[index2] is not None:
+                stack.pop()
+                continue
+            unloaded_indexes = [x for x in self.__get_parent_indexes(index2) if self.__vertices[x] is None]
+            if unloaded_indexes:
+                stack.extend(unloaded_indexes)
+            else:
+                self.__vertices[index2] = self.__materialize(index2)
+                stack.pop()
+        return self.__vertices[index]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def roots(self):
+        """The vertices that were passed to :func:`dump`."""
+        return [
+            self[_VERTEX_INDEX.unpack_from(self.__buffer, self.__root_indexes_offset + i * _VERTEX_INDEX.size)[0]]
+            for i in range(self.__root_count)
+        ]
+
+    def close(self):
+        if self.__close_func is not None:
+            self.__close_func()
+            self.__close_func = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def load(file, use_mmap=False):
+    """Load a vertex graph written by :func:`dump`.
+
+    Args:
+        file: path or readable binary file object.
+        use_mmap: if true, memory-map the file instead of reading it into memory; ``file`` must then be a path or a
+            real file with a ``fileno``.  Close the returned :class:`VertexFile` (or use it as a context manager) to
+            release the mapping; vertices that were already materialized remain valid.
+
+    Returns:
+        :class:`VertexFile`; use its ``roots`` property to get the vertices that were dumped.
+
+    Warning:
+        Labels and extra_hash values are stored with :mod:`pickle`, so only load files from trusted sources.
+    """
+    if not hasattr(file, 'read'):
+        with open(file, 'rb') as f:
+            return load(f, use_mmap)
+    if use_mmap:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return VertexFile(buffer, buffer.close)
+    return VertexFile(file.read())
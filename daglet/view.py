@@ -2,7 +2,6 @@ from __future__ import unicode_literals
 
 from builtins import str
 import daglet
-import tempfile
 
 
 def __import_graphviz():
@@ -42,6 +41,7 @@ def render(objs, parent_func, filename=None, rankdir='LR', vertex_color_func={}.
         edge_label_func={}.get):
     graph = __make_graph(objs, parent_func, rankdir, vertex_color_func, vertex_label_func, edge_label_func)
     if filename is None:
+        import tempfile
         filename = tempfile.mktemp()
     graph.render(filename)
     return filename
@@ -51,6 +51,7 @@ def view(objs, parent_func, filename=None, rankdir='LR', vertex_color_func={}.ge
         edge_label_func={}.get):
     graph = __make_graph(objs, parent_func, rankdir, vertex_color_func, vertex_label_func, edge_label_func)
     if filename is None:
+        import tempfile
         filename = tempfile.mktemp()
     graph.view(filename)
     return filename
@@ -9,8 +9,14 @@ from past.builtins import basestring
 from textwrap import dedent
 import copy
 import daglet
+import io
 import operator
+import os
+import pickle
+import pytest
 import subprocess
+import sys
+import tracemalloc
 
 
 def test__get_hash():
@@ -407,8 +413,7 @@ def test__example__vdom():
     # Create initial vdom.
     root = MainPage('some text')
     vdom = daglet.transform_vertices([root], Component.expand, Component.collapse)
-    # FIXME: combine `toposort` and `transform` so that the parent_func only gets hit once; expect only one render.
-    assert subpage_render_count[0] == 2
+    assert subpage_render_count[0] == 1
 
     # Turn vdom into text.
     rendered_root = vdom[root]
@@ -431,7 +436,7 @@ def test__example__vdom():
     # Create new vdom incrementally.
     root2 = MainPage('some other text')
     vdom2 = daglet.transform_vertices([root2], Component.expand, Component.collapse, vertex_map=vdom)
-    assert subpage_render_count[0] == 2
+    assert subpage_render_count[0] == 1
 
     # Turn vdom into text again, incrementally.  Only redraw changed portions.
     rendered_root2 = vdom2[root2]
@@ -450,3 +455,761 @@ def test__example__vdom():
         │ sub sub item        │
         └─────────────────────┘"""
     )
+
+
+def test__build_vertices():
+    v1 = daglet.Vertex('v1')
+    v2 = v1.vertex('v2')
+    v3 = daglet.Vertex('v3')
+    v4 = daglet.Vertex('v4', [v2, v3])
+    vertex_map = daglet.build_vertices(
+        ids=[4, 3, 2, 1],
+        labels=['v4', 'v3', 'v2', 'v1'],
+        edge_src=[3, 2, 1],
+        edge_dst=[4, 4, 2],
+    )
+    assert vertex_map == {1: v1, 2: v2, 3: v3, 4: v4}
+    assert vertex_map[4].parents == v4.parents
+    assert daglet.build_vertices(['a', 'b'], edge_src=['a'], edge_dst=['b'])['b'] == daglet.Vertex('a').vertex('b')
+    assert daglet.build_vertices(['a'], extra_hashes=[5])['a'] == daglet.Vertex('a', extra_hash=5)
+    assert daglet.build_vertices([]) == {}
+
+
+def test__build_vertices__errors():
+    with pytest.raises(RuntimeError):
+        daglet.build_vertices(['a', 'b'], edge_src=['a', 'b'], edge_dst=['b', 'a'])
+    with pytest.raises(ValueError):
+        daglet.build_vertices(['a'], edge_src=['a'], edge_dst=['b'])
+    with pytest.raises(ValueError):
+        daglet.build_vertices(['a', 'a'])
+    with pytest.raises(ValueError):
+        daglet.build_vertices(['a'], labels=['a', 'b'])
+
+
+def test__vertex_lazy_hash():
+    v1 = daglet.Vertex('v1', lazy_hash=True)
+    v2 = daglet.Vertex('v2', lazy_hash=True)
+    v3 = daglet.Vertex('v3', [v2, v1], lazy_hash=True)
+    assert v3.lazy_hash
+    assert v3.parents == [v2, v1]
+    assert v3.vertex('v4').lazy_hash
+    assert v3.clone(label='v5').lazy_hash
+    assert v3.transplant([v1]).lazy_hash
+    assert not v3.clone(lazy_hash=False).lazy_hash
+    assert hash(v3) == hash(daglet.Vertex('v3', [daglet.Vertex('v1'), daglet.Vertex('v2')]))
+    assert v3 == daglet.Vertex('v3', [v1, v2], lazy_hash=True)
+    assert v3.short_hash == daglet.Vertex('v3', [daglet.Vertex('v2'), daglet.Vertex('v1')]).short_hash
+    assert hash(daglet.Vertex('v1', lazy_hash=True)) == 352423289548818779
+
+
+def test__vertex_lazy_hash__deep():
+    vertex = daglet.Vertex(0, lazy_hash=True)
+    for i in range(5000):
+        vertex = vertex.vertex(i + 1)
+    expected = daglet.Vertex(0)
+    for i in range(5000):
+        expected = expected.vertex(i + 1)
+    assert hash(vertex) == hash(expected)
+
+
+def test__dump_load(tmpdir):
+    v1 = daglet.Vertex('v1')
+    v2 = daglet.Vertex({'a': [1, 2]}, [v1], extra_hash=5)
+    v3 = daglet.Vertex('v1', [v1, v2])
+    v4 = daglet.Vertex(None, [v2, v3])
+    buf = io.BytesIO()
+    daglet.dump([v4, v3], buf)
+    buf.seek(0)
+    vertex_file = daglet.load(buf)
+    assert len(vertex_file) == 4
+    assert list(vertex_file) == daglet.toposort([v4])
+    assert vertex_file.roots == [v4, v3]
+    loaded_v4 = vertex_file.roots[0]
+    assert loaded_v4.parents == v4.parents
+    loaded_v2 = loaded_v4.parents[loaded_v4.parents.index(v2)]
+    assert loaded_v2.label == {'a': [1, 2]}
+    assert loaded_v2.extra_hash == 5
+    assert vertex_file[-1] is loaded_v4
+
+    filename = str(tmpdir.join('graph.daglet'))
+    daglet.dump([v4], filename)
+    with daglet.load(filename, use_mmap=True) as vertex_file:
+        roots = vertex_file.roots
+    assert roots == [v4]
+    assert [x.parents for x in roots[0].parents] == [x.parents for x in v4.parents]
+
+    with pytest.raises(ValueError):
+        daglet.load(io.BytesIO(b'x' * 100))
+
+
+def test__dump_load__deep(tmpdir):
+    vertex = daglet.Vertex(0)
+    for i in range(5000):
+        vertex = vertex.vertex(i % 3)
+    filename = str(tmpdir.join('graph.daglet'))
+    daglet.dump([vertex], filename)
+    with daglet.load(filename, use_mmap=True) as vertex_file:
+        assert len(vertex_file) == 5001
+        assert vertex_file[-2] == vertex.parents[0]
+        assert vertex_file.roots == [vertex]
+
+
+def test__vertex_pickle():
+    v1 = daglet.Vertex('v1')
+    v2 = daglet.Vertex(['v2'], [v1], extra_hash={'x': 1})
+    v3 = daglet.Vertex('v3', [v1, v2], lazy_hash=True)
+    for vertex in [v1, v2, v3]:
+        vertex2 = pickle.loads(pickle.dumps(vertex, protocol=2))
+        assert vertex2 == vertex
+        assert vertex2.parents == vertex.parents
+        assert vertex2.label == vertex.label
+        assert vertex2.extra_hash == vertex.extra_hash
+        assert vertex2.lazy_hash == vertex.lazy_hash
+    v3b = pickle.loads(pickle.dumps(v3, protocol=2))
+    assert v3b.parents[1].parents[0] is v3b.parents[0]
+
+
+def test__vertex_copy():
+    v1 = daglet.Vertex(['v1'])
+    v2 = daglet.Vertex('v2', [v1])
+    assert copy.copy(v2) is v2
+    v2b = copy.deepcopy(v2)
+    assert v2b == v2
+    assert v2b is not v2
+    assert v2b.parents[0].label == ['v1']
+    assert v2b.parents[0].label is not v1.label
+
+
+def test__vertex_pickle__shared_ancestors():
+    vertices = [daglet.Vertex(0)]
+    for i in range(500):
+        vertices.append(vertices[-1].vertex(i))
+    data = pickle.dumps(vertices, protocol=2)
+    assert len(data) < 4 * len(pickle.dumps(vertices[-1], protocol=2))
+    vertices2 = pickle.loads(data)
+    assert vertices2 == vertices
+    assert all(vertices2[i].parents[0] is vertices2[i - 1] for i in range(1, len(vertices2)))
+
+    vertex_map = pickle.loads(pickle.dumps({x: i for i, x in enumerate(vertices)}, protocol=2))
+    vertex_ids = set(id(x) for x in vertex_map)
+    assert all(id(x.parents[0]) in vertex_ids for x in vertex_map if x.parents)
+
+    vertices3 = copy.deepcopy(vertices)
+    assert vertices3 == vertices
+    assert all(vertices3[i].parents[0] is vertices3[i - 1] for i in range(1, len(vertices3)))
+
+
+def test__vertex_pickle__deep():
+    vertex = daglet.Vertex(0)
+    for i in range(20000):
+        vertex = vertex.vertex(i)
+    assert pickle.loads(pickle.dumps(vertex, protocol=2)) == vertex
+    assert copy.deepcopy(vertex) == vertex
+
+
+class _UnpicklableLabel(object):
+    def __repr__(self):
+        return '_UnpicklableLabel()'
+
+    def __copy__(self):
+        return self
+
+    def __reduce__(self):
+        raise ValueError('Not picklable')
+
+
+def test__vertex_pickle__failure():
+    vertex = daglet.Vertex(_UnpicklableLabel())
+    for i in range(200):
+        vertex = vertex.vertex(i)
+    with pytest.raises(ValueError):
+        pickle.dumps(vertex, protocol=2)
+    assert daglet._get_open_pickle_scopes() == []
+
+    vertex = daglet.Vertex(0)
+    for i in range(200):
+        vertex = vertex.vertex(i)
+    assert pickle.loads(pickle.dumps(vertex, protocol=2)) == vertex
+    assert daglet._get_open_pickle_scopes() == []
+
+
+def test__dynamic_dag():
+    dag = daglet.DynamicDag()
+    assert dag.add_edge('b', 'c') == []
+    assert dag.order == ['b', 'c']
+    assert dag.add_edge('a', 'b') == ['a', 'b', 'c']
+    assert dag.order == ['a', 'b', 'c']
+    assert dag.add_edge('c', 'd') == []
+    dag.add_vertex('x')
+    assert dag.add_edge('x', 'y') == []
+    assert dag.add_edge('y', 'b') == ['x', 'y', 'b', 'c', 'd']
+    assert dag.order == ['a', 'x', 'y', 'b', 'c', 'd']
+    with pytest.raises(RuntimeError):
+        dag.add_edge('d', 'x')
+    with pytest.raises(RuntimeError):
+        dag.add_edge('a', 'a')
+    with pytest.raises(RuntimeError):
+        dag.add_edge('z', 'z')
+    assert 'z' not in dag
+    assert len(dag) == 6
+    assert not dag.has_edge('d', 'x')
+    assert dag.order == ['a', 'x', 'y', 'b', 'c', 'd']
+    assert dag.get_parents('b') == ['a', 'y']
+    assert dag.get_children('b') == ['c']
+    assert len(dag) == 6
+    assert 'x' in dag
+    assert 'z' not in dag
+    order = dag.order
+    assert all(dag.index(x) == i for i, x in enumerate(order))
+    assert all(order.index(parent) < order.index(obj) for obj in order for parent in dag.get_parents(obj))
+    assert daglet.toposort(['d'], dag.get_parents) == ['a', 'x', 'y', 'b', 'c', 'd']
+
+
+def test__dynamic_dag__affected_region():
+    dag = daglet.DynamicDag()
+    for obj in ['a', 'b', 'c', 'd', 'e']:
+        dag.add_vertex(obj)
+    dag.add_edge('b', 'c')
+    assert dag.add_edge('d', 'b') == ['d', 'b', 'c']
+    assert dag.order == ['a', 'd', 'b', 'c', 'e']
+
+
+def test__dynamic_dag__random():
+    import random
+    rand = random.Random(0)
+    dag = daglet.DynamicDag()
+    edges = set()
+    for _ in range(500):
+        parent, child = rand.randrange(60), rand.randrange(60)
+        try:
+            dag.add_edge(parent, child)
+            edges.add((parent, child))
+        except RuntimeError:
+            pass
+        index_map = {x: i for i, x in enumerate(dag.order)}
+        assert all(index_map[x] < index_map[y] for x, y in edges)
+    assert sorted(dag.order) == sorted(set(x for edge in edges for x in edge) | set(dag.order))
+
+
+def test__dynamic_dag__from_objs():
+    v1 = daglet.Vertex('v1')
+    v2 = v1.vertex('v2')
+    dag = daglet.DynamicDag([v2])
+    assert dag.order == [v1, v2]
+    assert dag.get_parents(v2) == [v1]
+
+
+def test__get_upward_ranks():
+    v1 = daglet.Vertex('v1')
+    v2 = v1.vertex('v2')
+    v3 = v2.vertex('v3')
+    v4 = v1.vertex('v4')
+    cost_map = {v1: 1., v2: 2., v3: 3., v4: 10.}
+    rank_map = daglet.schedule.get_upward_ranks([v3, v4], cost_func=cost_map.get)
+    assert rank_map == {v1: 11., v2: 5., v3: 3., v4: 10.}
+    assert daglet.schedule.get_upward_ranks([v3, v4]) == {v1: 3., v2: 2., v3: 1., v4: 1.}
+    assert daglet.schedule.predict_makespan([v3, v4], cost_func=cost_map.get, worker_count=1) == 16.
+    assert daglet.schedule.predict_makespan([v3, v4], cost_func=cost_map.get, worker_count=2) == 11.
+
+
+def test__parallel_transform():
+    get_parents = lambda x: x.parents
+    v3 = daglet.Vertex('v3')
+    v4 = v3.vertex('v4')
+    v5 = v3.vertex('v5')
+    v6 = v5.vertex('v6')
+    v7 = v5.vertex('v7')
+    v8 = daglet.Vertex('v8')
+    v9 = daglet.Vertex('v9', [v4, v6, v7])
+    v10 = daglet.Vertex('v10', [v3, v8])
+    v11 = daglet.Vertex('v11')
+    objs = [v4, v9, v10, v11]
+    vertex_rank_func = lambda obj, parent_ranks: max(parent_ranks) + 1 if len(parent_ranks) else 0
+    expected = daglet.transform(objs, get_parents, vertex_rank_func)
+    for worker_count in [1, 3]:
+        vertex_map, edge_map, report = daglet.parallel_transform(objs, get_parents, vertex_rank_func,
+            worker_count=worker_count)
+        assert (vertex_map, edge_map) == expected
+        assert report.worker_count == worker_count
+        assert report.predicted_makespan == (9. if worker_count == 1 else 4.)
+        assert report.actual_makespan >= 0.
+        assert set(report.duration_map) == set(vertex_map)
+
+    vertex_map, _, _ = daglet.parallel_transform([v9], get_parents, vertex_rank_func, vertex_map={v5: 10})
+    assert vertex_map == {v3: 0, v4: 1, v5: 10, v6: 11, v7: 11, v9: 12}
+
+    def fail(obj, parent_values):
+        raise ValueError(obj)
+    with pytest.raises(ValueError):
+        daglet.parallel_transform(objs, get_parents, fail)
+
+
+def test__parallel_transform__cost_model():
+    v1 = daglet.Vertex('v1')
+    v2 = v1.vertex('v2')
+    cost_model = daglet.CostModel(key_func=lambda x: x.label, default_cost=5.)
+    assert cost_model(v1) == 5.
+    daglet.parallel_transform([v2], cost_model=cost_model)
+    assert cost_model(v1) < 5.
+    assert cost_model(daglet.Vertex('v2')) < 5.
+    cost_model = daglet.CostModel()
+    cost_model.record(v1, 2.)
+    cost_model.record(v1, 4.)
+    assert cost_model.get_cost(v1) == 3.
+    assert cost_model.get_cost(v2) == 1.
+
+
+def test__canonicalize():
+    class Op(object):
+        def __init__(self, name, inputs=[]):
+            self.name = name
+            self.inputs = inputs
+
+    get_inputs = lambda x: x.inputs
+    get_name = lambda x: x.name
+    a1 = Op('a')
+    a2 = Op('a')
+    b1 = Op('b', [a1])
+    b2 = Op('b', [a2])
+    c = Op('c', [b1, b2])
+    d = Op('d', [a2, b1])
+    obj_map, parent_map = daglet.canonicalize([c, d], get_inputs, get_name)
+    a = obj_map[a1]
+    b = obj_map[b1]
+    assert a in [a1, a2]
+    assert b in [b1, b2]
+    assert obj_map == {a1: a, a2: a, b1: b, b2: b, c: c, d: d}
+    assert parent_map == {a: [], b: [a], c: [b, b], d: [a, b]}
+
+    call_counts = {}
+
+    def evaluate(obj, parent_values):
+        call_counts[obj.name] = call_counts.get(obj.name, 0) + 1
+        return '{}({})'.format(obj.name, ', '.join(parent_values))
+
+    vertex_map = daglet.transform_vertices([obj_map[c], obj_map[d]], parent_map.__getitem__, evaluate)
+    assert vertex_map[obj_map[c]] == 'c(b(a()), b(a()))'
+    assert vertex_map[obj_map[d]] == 'd(a(), b(a()))'
+
+    # Keys that only look alike (e.g. when printed) must not be merged.
+    ops = [Op(1), Op('1'), Op(('x, y',)), Op(('x', 'y'))]
+    e = Op('e', ops + [Op('f', [x]) for x in ops])
+    obj_map, parent_map = daglet.canonicalize([e], get_inputs, get_name)
+    assert len(set(obj_map.values())) == 9
+    assert call_counts == {'a': 1, 'b': 1, 'c': 1, 'd': 1}
+
+    e1 = Op('e', [a1, b1])
+    e2 = Op('e', [b1, a1])
+    obj_map, _ = daglet.canonicalize([e1, e2], get_inputs, get_name)
+    assert obj_map[e1] is not obj_map[e2]
+
+
+def test__toposort__tree():
+    v1 = daglet.Vertex('v1')
+    v2 = v1.vertex('v2')
+    v3 = daglet.Vertex('v3', [v1, v2])
+    sorted_vertices = daglet.toposort([v3], tree=True)
+    assert sorted([x.label for x in sorted_vertices]) == ['v1', 'v1', 'v2', 'v3']
+    assert sorted_vertices[-1] == v3
+    assert len(daglet.toposort([v3, v3], tree=True)) == 8
+
+
+def test__toposort__cycle():
+    parent_map = {'a': ['b'], 'b': ['c'], 'c': ['a']}
+    with pytest.raises(RuntimeError):
+        daglet.toposort(['a'], parent_map.get)
+
+
+def test__toposort__deep():
+    vertex = daglet.Vertex(0)
+    for i in range(20000):
+        vertex = vertex.vertex(i)
+    sorted_vertices = daglet.toposort([vertex])
+    assert len(sorted_vertices) == 20001
+    assert sorted_vertices[-1] == vertex
+
+
+def test__transitive_reduction():
+    parent_map = {
+        'a': [],
+        'b': ['a'],
+        'c': ['a', 'b'],
+        'd': ['c', 'a', 'b', 'c'],
+        'e': ['b'],
+        'f': ['d', 'e', 'a'],
+    }
+    assert daglet.transitive_reduction(['f'], parent_map.get) == {
+        'a': [],
+        'b': ['a'],
+        'c': ['b'],
+        'd': ['c'],
+        'e': ['b'],
+        'f': ['d', 'e'],
+    }
+
+    v1 = daglet.Vertex('v1')
+    v2 = v1.vertex('v2')
+    v3 = daglet.Vertex('v3', [v1, v2])
+    v4 = daglet.Vertex('v4', [v1, v3])
+    vertex_map = daglet.transitive_reduction_vertices([v4])
+    assert vertex_map[v4] == v1.vertex('v2').vertex('v3').vertex('v4')
+    assert vertex_map[v1] == v1
+
+
+def test__transitive_reduction__memory():
+    # Only the bitsets of vertices with unprocessed children should be kept; holding the ancestor bitsets of every
+    # vertex in this chain would take about 50 MB.
+    count = 20000
+    parent_func = lambda x: [x - 1, x - 2] if x > 1 else [x - 1] if x else []
+    tracemalloc.start()
+    try:
+        parent_map = daglet.transitive_reduction([count - 1], parent_func)
+        _, peak_size = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert parent_map == {x: [x - 1] if x else [] for x in range(count)}
+    assert peak_size < 20 * 1024 * 1024
+
+
+def test__lazy_import():
+    script = dedent('''\
+        import daglet, sys
+        loaded = lambda: sorted(x for x in sys.modules if x.startswith(('daglet.', 'past', 'graphviz')))
+        print(loaded())
+        daglet.dump
+        print(loaded())
+    ''')
+    output = subprocess.check_output([sys.executable, '-c', script]).decode().splitlines()
+    if sys.version_info >= (3, 7):
+        assert output[0] == str(['daglet._utils', 'daglet.view'])
+        assert output[1] == str(['daglet._utils', 'daglet.serialize', 'daglet.view'])
+    assert 'DynamicDag' in dir(daglet)
+    assert daglet.DynamicDag is daglet.dynamic.DynamicDag
+    with pytest.raises(AttributeError):
+        daglet.nonexistent
+
+    script = 'import daglet.view; assert callable(daglet.view); print(daglet.view.__module__)'
+    assert subprocess.check_output([sys.executable, '-c', script]).decode().strip() == 'daglet.view'
+    script = 'import daglet.partitioning; assert callable(daglet.partition); print(daglet.partition.__module__)'
+    assert subprocess.check_output([sys.executable, '-c', script]).decode().strip() == 'daglet.partitioning'
+
+
+def _distributed_rank(obj, parent_ranks):
+    return max(parent_ranks) + 1 if len(parent_ranks) else 0
+
+
+def _distributed_crash_once(obj, parent_values):
+    """Kill the worker process the first time a ``crash:<marker_path>`` object is evaluated."""
+    if obj.startswith('crash:'):
+        marker_path = obj.split(':', 1)[1]
+        if not os.path.exists(marker_path):
+            open(marker_path, 'w').close()
+            os._exit(1)
+    return '{}({})'.format(obj.split(':')[0], ', '.join(parent_values))
+
+
+def _distributed_fail(obj, parent_values):
+    raise ValueError(obj)
+
+
+def test__distributed_transform():
+    get_parents = lambda x: x.parents
+    v3 = daglet.Vertex('v3')
+    v4 = v3.vertex('v4')
+    v5 = v3.vertex('v5')
+    v6 = v5.vertex('v6')
+    v7 = v5.vertex('v7')
+    v8 = daglet.Vertex('v8')
+    v9 = daglet.Vertex('v9', [v4, v6, v7])
+    v10 = daglet.Vertex('v10', [v3, v8])
+    v11 = daglet.Vertex('v11')
+    objs = [v4, v9, v10, v11]
+    expected = daglet.transform(objs, get_parents, _distributed_rank)
+    with daglet.distributed.LocalCluster(3) as cluster:
+        assert daglet.distributed_transform(objs, get_parents, _distributed_rank, cluster=cluster) == expected
+        assert daglet.distributed_transform(objs, get_parents, _distributed_rank, cluster=cluster) == expected
+        assert daglet.distributed_transform([], get_parents, _distributed_rank, cluster=cluster) == ({}, {})
+        with pytest.raises(ValueError):
+            daglet.distributed_transform(objs, get_parents, _distributed_fail, cluster=cluster)
+
+
+def test__distributed_transform__worker_failure(tmpdir):
+    crash_obj = 'crash:{}'.format(tmpdir.join('crashed'))
+    parent_map = {
+        'a': [],
+        'b': ['a'],
+        'c': ['a'],
+        crash_obj: ['b', 'c'],
+        'e': [crash_obj, 'a'],
+    }
+    with daglet.distributed.LocalCluster(3) as cluster:
+        vertex_map, edge_map = daglet.distributed_transform(['e'], parent_map.get, _distributed_crash_once,
+            cluster=cluster)
+        assert vertex_map['e'] == 'e(crash(b(a()), c(a())), a())'
+        assert edge_map[crash_obj, 'e'] == vertex_map[crash_obj]
+        assert len(edge_map) == 6
+        assert sum(x.is_alive() for x in cluster.processes) == 2
+
+        cluster.kill(0)
+        cluster.kill(1)
+        cluster.kill(2)
+        with pytest.raises(daglet.distributed.WorkerFailedError):
+            daglet.distributed_transform(['e'], parent_map.get, _distributed_crash_once, cluster=cluster)
+
+
+def test__distributed_transform__colliding_hashes():
+    # `hash(-1) == hash(-2)` in CPython, so objects can't be keyed by their hashes.
+    parent_map = {-1: [], -2: [-1], -3: [-1, -2]}
+    expected = daglet.transform([-3], parent_map.get, _distributed_rank)
+    with daglet.distributed.LocalCluster(2) as cluster:
+        assert daglet.distributed_transform([-3], parent_map.get, _distributed_rank, cluster=cluster) == expected
+        with pytest.raises(ValueError):
+            daglet.distributed_transform([-3], parent_map.get, _distributed_rank, cluster=cluster, key_func=hash)
+
+
+def test__get_path_counts():
+    v1 = daglet.Vertex('v1')
+    v2 = v1.vertex('v2')
+    v3 = daglet.Vertex('v3', [v1, v2])
+    v4 = daglet.Vertex('v4', [v2, v3])
+    assert daglet.get_path_counts([v4]) == {v1: 3, v2: 2, v3: 1, v4: 1}
+    assert daglet.get_path_counts([v4, v2]) == {v1: 4, v2: 3, v3: 1, v4: 1}
+    assert sum(daglet.get_path_counts([v4, v2]).values()) == len(daglet.toposort([v4, v2], tree=True))
+
+    # Chain of diamonds, with 2**100 paths to the bottom.
+    vertex = daglet.Vertex(0)
+    for i in range(100):
+        vertex = daglet.Vertex(i, [vertex.vertex('a'), vertex.vertex('b')])
+    assert daglet.get_path_counts([vertex])[daglet.Vertex(0)] == 2**100
+
+
+def test__iter_tree():
+    parent_map = {'a': [], 'b': ['a'], 'c': ['a', 'b'], 'd': ['b', 'c']}
+    items = list(daglet.iter_tree(['d', 'b'], parent_map.get))
+    assert [x[0] for x in items] == daglet.toposort(['d', 'b'], parent_map.get, tree=True)
+    assert items[:4] == [
+        ('a', ('b', 'a')),
+        ('b', ('b',)),
+        ('a', ('d', 'b', 'a')),
+        ('b', ('d', 'b')),
+    ]
+    assert items[-1] == ('d', ('d',))
+
+    vertex = daglet.Vertex(0)
+    for i in range(100):
+        vertex = daglet.Vertex(i, [vertex.vertex('a'), vertex.vertex('b')])
+    tree_iter = daglet.iter_tree([vertex])
+    obj, path = next(tree_iter)
+    assert obj == daglet.Vertex(0)
+    assert len(path) == 201
+
+
+def test__partition():
+    # Two independent chains, joined at the end.
+    parent_map = {'a0': [], 'b0': []}
+    for i in range(1, 10):
+        parent_map['a{}'.format(i)] = ['a{}'.format(i - 1)]
+        parent_map['b{}'.format(i)] = ['b{}'.format(i - 1)]
+    parent_map['c'] = ['a9', 'b9']
+    result = daglet.partition(['c'], parent_map.get, 2, epsilon=0.1)
+    assert sorted(len(x) for x in result.parts) == [10, 11]
+    assert result.cut_edge_count == 1
+    assert result.balance == 11 / 10.5
+    assert result.get_part_parent_map() == {0: [], 1: [0]}
+    for i, part in enumerate(result.parts):
+        assert all(result.part_map[x] == i for x in part)
+    for obj, part_index in result.part_map.items():
+        assert all(result.part_map[x] <= part_index for x in parent_map[obj])
+
+    result = daglet.partition(['c'], parent_map.get, 1)
+    assert result.parts == [daglet.toposort(['c'], parent_map.get)]
+    assert result.cut_edges == []
+    assert result.balance == 1.
+
+    costs = {x: 10 if x == 'a0' else 1 for x in parent_map}
+    result = daglet.partition(['c'], parent_map.get, 2, cost_func=costs.get)
+    assert result.part_costs == [sum(costs[x] for x in part) for part in result.parts]
+    assert result.part_costs == [15, 15]
+    assert result.cut_edge_count == 1
+
+    result = daglet.partition(['a0'], parent_map.get, 3)
+    assert result.parts == [['a0'], [], []]
+
+    with pytest.raises(ValueError):
+        daglet.partition(['c'], parent_map.get, 0)
+
+
+def test__partition__random():
+    import random
+    rand = random.Random(0)
+    parent_map = {i: rand.sample(range(i), min(i, rand.randrange(3))) for i in range(200)}
+    objs = list(range(200))
+    for k in [2, 3, 7]:
+        result = daglet.partition(objs, parent_map.get, k)
+        assert sorted(x for part in result.parts for x in part) == objs
+        assert result.balance <= 1.05
+        for obj in objs:
+            assert all(result.part_map[x] <= result.part_map[obj] for x in parent_map[obj])
+        cut_edges = [(x, obj) for obj in objs for x in parent_map[obj] if result.part_map[x] != result.part_map[obj]]
+        assert sorted(result.cut_edges) == sorted(cut_edges)
+
+
+def test__transform__batch():
+    get_parents = lambda x: x.parents
+    v3 = daglet.Vertex('v3')
+    v4 = v3.vertex('v4')
+    v5 = v3.vertex('v5')
+    v6 = v5.vertex('v6')
+    v7 = v5.vertex('v7')
+    v8 = daglet.Vertex('v8')
+    v9 = daglet.Vertex('v9', [v4, v6, v7])
+    v10 = daglet.Vertex('v10', [v3, v8])
+    v11 = daglet.Vertex('v11')
+    objs = [v4, v9, v10, v11]
+    vertex_rank_func = lambda obj, parent_ranks: max(parent_ranks) + 1 if len(parent_ranks) else 0
+    batches = []
+
+    def batch_rank_func(objs, parent_ranks_list):
+        batches.append(objs)
+        return [vertex_rank_func(x, y) for x, y in zip(objs, parent_ranks_list)]
+
+    expected = daglet.transform(objs, get_parents, vertex_rank_func)
+    assert daglet.transform(objs, get_parents, batch_vertex_func=batch_rank_func) == expected
+    assert [sorted(x.label for x in batch) for batch in batches] == [
+        ['v11', 'v3', 'v8'],
+        ['v10', 'v4', 'v5'],
+        ['v6', 'v7'],
+        ['v9'],
+    ]
+
+    del batches[:]
+    assert daglet.transform(objs, get_parents, batch_vertex_func=batch_rank_func, batch_size=2) == expected
+    assert [len(x) for x in batches] == [2, 1, 2, 1, 2, 1]
+
+    del batches[:]
+    vertex_map, _ = daglet.transform([v9], get_parents, batch_vertex_func=batch_rank_func, vertex_map={v5: 10})
+    assert vertex_map == {v3: 0, v4: 1, v5: 10, v6: 11, v7: 11, v9: 12}
+    assert [sorted(x.label for x in batch) for batch in batches] == [['v3', 'v6', 'v7'], ['v4'], ['v9']]
+
+    with pytest.raises(ValueError):
+        daglet.transform(objs, get_parents, batch_vertex_func=lambda objs, parent_values_list: [])
+    with pytest.raises(TypeError):
+        daglet.transform(objs, get_parents, vertex_rank_func, batch_vertex_func=batch_rank_func)
+
+
+def test__batch_parent_func():
+    parent_map = {
+        'a': [],
+        'b': ['a'],
+        'c': ['a', 'b'],
+        'd': ['c'],
+        'e': ['b', 'd'],
+    }
+    calls = []
+
+    def batch_parent_func(objs):
+        calls.append(sorted(objs))
+        return {x: parent_map[x] for x in objs}
+
+    expected = daglet.toposort(['e'], parent_map.get)
+    assert daglet.toposort(['e'], batch_parent_func=batch_parent_func) == expected
+    assert calls == [['e'], ['b', 'd'], ['a', 'c']]
+
+    del calls[:]
+    assert daglet.toposort(['e'], batch_parent_func=batch_parent_func, parent_batch_size=1) == expected
+    assert sorted(calls) == [['a'], ['b'], ['c'], ['d'], ['e']]
+
+    for prefetch in [1, 3]:
+        del calls[:]
+        assert daglet.toposort(['e', 'c'], batch_parent_func=batch_parent_func, parent_batch_size=1,
+            prefetch=prefetch) == daglet.toposort(['e', 'c'], parent_map.get)
+        assert sorted(calls) == [['a'], ['b'], ['c'], ['d'], ['e']]
+
+    vertex_rank_func = lambda obj, parent_ranks: max(parent_ranks) + 1 if len(parent_ranks) else 0
+    del calls[:]
+    assert daglet.transform(['e'], vertex_func=vertex_rank_func, batch_parent_func=batch_parent_func) == (
+        daglet.transform(['e'], parent_map.get, vertex_rank_func))
+    assert len(calls) == 3
+
+    del calls[:]
+    vertex_map, _ = daglet.transform(['e'], vertex_func=vertex_rank_func, vertex_map={'d': 10},
+        batch_parent_func=batch_parent_func, prefetch=2)
+    assert vertex_map == {'a': 0, 'b': 1, 'd': 10, 'e': 11}
+    assert sorted(x for call in calls for x in call) == ['a', 'b', 'e']
+
+    def fail(objs):
+        raise ValueError(objs)
+    with pytest.raises(ValueError):
+        daglet.toposort(['e'], batch_parent_func=fail, prefetch=1)
+
+    with pytest.raises(TypeError):
+        daglet.toposort(['e'], parent_map.get, batch_parent_func=batch_parent_func)
+    with pytest.raises(TypeError):
+        daglet.transform(['e'], parent_map.get, vertex_rank_func, batch_parent_func=batch_parent_func)
+
+
+def test__transform__parent_func_called_once():
+    parent_map = {'a': [], 'b': ['a'], 'c': ['a', 'b']}
+    calls = []
+
+    def get_parents(obj):
+        calls.append(obj)
+        return parent_map[obj]
+    daglet.transform(['c'], get_parents)
+    assert sorted(calls) == ['a', 'b', 'c']
+
+
+def test__dump_load__distinct_equal_labels():
+    vertices = [daglet.Vertex((1, True)), daglet.Vertex((1, 1)), daglet.Vertex(0.0), daglet.Vertex(-0.0)]
+    buf = io.BytesIO()
+    daglet.dump(vertices, buf)
+    buf.seek(0)
+    roots = daglet.load(buf).roots
+    assert [repr(x.label) for x in roots] == [repr(x.label) for x in vertices]
+    assert all(hash(x) == hash(daglet.Vertex(x.label)) for x in roots)
+
+
+class _LoadRecordingLabel(object):
+    loaded_names = []
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return '_LoadRecordingLabel({!r})'.format(self.name)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        _LoadRecordingLabel.loaded_names.append(self.name)
+
+
+def test__dump_load__lazy_labels():
+    v1 = daglet.Vertex(_LoadRecordingLabel('v1'))
+    v2 = v1.vertex(_LoadRecordingLabel('v2'))
+    v3 = v2.vertex(_LoadRecordingLabel('v3'))
+    buf = io.BytesIO()
+    daglet.dump([v3], buf)
+    buf.seek(0)
+    del _LoadRecordingLabel.loaded_names[:]
+    vertex_file = daglet.load(buf)
+    assert _LoadRecordingLabel.loaded_names == []
+    assert vertex_file[1] == v2
+    assert set(_LoadRecordingLabel.loaded_names) == {'v1', 'v2'}
+    assert vertex_file.roots == [v3]
+
+
+def test__dump_load__lazy_hash():
+    v1 = daglet.Vertex('v1', lazy_hash=True)
+    v2 = daglet.Vertex('v2', lazy_hash=True)
+    v3 = daglet.Vertex('v3', [v2, v1], lazy_hash=True)
+    v4 = daglet.Vertex('v4', [v3, v1])
+    buf = io.BytesIO()
+    daglet.dump([v4, v3], buf)
+    buf.seek(0)
+    loaded_v4, loaded_v3 = daglet.load(buf).roots
+    assert loaded_v3.lazy_hash
+    assert not loaded_v4.lazy_hash
+    assert loaded_v3.parents == [v2, v1]
+    assert loaded_v4.parents == v4.parents
+    assert hash(loaded_v3) == hash(v3)
+    assert loaded_v3.vertex('v5') == v3.vertex('v5')